@@ -18,25 +18,17 @@ Usage:
 
 import sys
 import os
+import argparse
 import subprocess
+import importlib.util
 from typing import List
 
 
 def check_dependencies() -> List[str]:
     """Check if required dependencies are installed"""
-    missing = []
-    
-    try:
-        import cryptography
-    except ImportError:
-        missing.append("cryptography")
-    
-    try:
-        import colorama
-    except ImportError:
-        missing.append("colorama")
-    
-    return missing
+    # find_spec only locates the packages; importing cryptography would load OpenSSL
+    return [name for name in ("cryptography", "colorama")
+            if importlib.util.find_spec(name) is None]
 
 
 def install_dependencies():
@@ -169,35 +161,32 @@ Features:
     """)
 
 
+# command -> (handler, needs dependencies); each handler imports its own modules
+COMMANDS = {
+    "server": (run_server, True),
+    "client": (run_client, True),
+    "gui": (run_gui, True),
+    "install": (install_dependencies, False),
+    "help": (show_help, False),
+}
+
+
 def main():
     """Main entry point"""
-    if len(sys.argv) < 2:
-        command = "gui"
-    else:
-        command = sys.argv[1].lower()
+    parser = argparse.ArgumentParser(prog="fosen_vpn.py", add_help=False)
+    parser.add_argument("command", nargs="?", default="gui", type=str.lower)
+    args, _ = parser.parse_known_args()  # extra arguments were always ignored
     
-    if command == "install":
-        install_dependencies()
-    elif command == "server":
-        if check_dependencies():
-            print("Dependencies missing. Run: python fosen_vpn.py install")
-            return
-        run_server()
-    elif command == "client":
-        if check_dependencies():
-            print("Dependencies missing. Run: python fosen_vpn.py install")
-            return
-        run_client()
-    elif command == "gui":
-        if check_dependencies():
-            print("Dependencies missing. Run: python fosen_vpn.py install")
-            return
-        run_gui()
-    elif command == "help":
-        show_help()
-    else:
-        print(f"Unknown command: {command}")
+    if args.command not in COMMANDS:
+        print(f"Unknown command: {args.command}")
         print("Use 'python fosen_vpn.py help' for available commands")
+        return
+    
+    handler, needs_dependencies = COMMANDS[args.command]
+    if needs_dependencies and check_dependencies():
+        print("Dependencies missing. Run: python fosen_vpn.py install")
+        return
+    handler()
 
 
 if __name__ == "__main__":
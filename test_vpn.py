@@ -6,12 +6,15 @@ import unittest
 import threading
 import time
 import socket
-from unittest.mock import Mock, patch
+import queue
+import asyncio
+from unittest.mock import Mock, AsyncMock, patch
 
 # Import VPN components
 try:
-    from vpn_server import VPNServer, VPNProtocol, VPNEncryption
+    from vpn_server import VPNServer, VPNProtocol, VPNEncryption, VPNLogger, run_server_process
     from vpn_client import VPNClient
+    from vpn_locations import VPNServerLocation
 except ImportError:
     print("Warning: VPN modules not found for testing")
 
@@ -48,6 +51,40 @@ class TestVPNProtocol(unittest.TestCase):
         invalid_packet = b"XXXX" + b"\x01\x01\x00\x00\x00\x00"
         with self.assertRaises(ValueError):
             VPNProtocol.parse_packet(invalid_packet)
+        
+        # Length field beyond MAX_PAYLOAD is refused from the header alone
+        oversized = VPNProtocol.create_header(VPNProtocol.MSG_DATA, VPNProtocol.MAX_PAYLOAD + 1)
+        with self.assertRaisesRegex(ValueError, "Oversized"):
+            VPNProtocol.parse_packet(oversized)
+    
+    def test_records(self):
+        """Test batching several messages into one data frame"""
+        messages = [b"first", b"", b"third message"]
+        body = b"".join(VPNProtocol.pack_record(m) for m in messages)
+        
+        self.assertEqual(VPNProtocol.unpack_records(body), messages)
+        
+        # Truncated record
+        with self.assertRaises(ValueError):
+            VPNProtocol.unpack_records(body[:-1])
+    
+    def test_sendmsg_short_writes(self):
+        """Test that gathered sends resume correctly after partial writes"""
+        from vpn_client import VPNProtocol  # client-only helpers
+        written = bytearray()
+        
+        def sendmsg(buffers):
+            # Accept at most 1000 bytes per call, like a full socket buffer
+            chunk = b"".join(bytes(b) for b in buffers)[:1000]
+            written.extend(chunk)
+            return len(chunk)
+        
+        sock = Mock()
+        sock.sendmsg.side_effect = sendmsg
+        payload = bytes(range(256)) * 20
+        VPNProtocol._sendmsg_all(sock, [b"header", payload])
+        
+        self.assertEqual(bytes(written), b"header" + payload)
 
 
 class TestVPNEncryption(unittest.TestCase):
@@ -63,11 +100,53 @@ class TestVPNEncryption(unittest.TestCase):
         # Encrypt
         encrypted = encryption.encrypt(original_data)
         self.assertNotEqual(encrypted, original_data)
+        self.assertEqual(len(encrypted), VPNProtocol.AES_IV_SIZE + len(original_data) +
+                         VPNProtocol.AES_TAG_SIZE)
         
         # Decrypt
         decrypted = encryption.decrypt(encrypted)
         self.assertEqual(decrypted, original_data)
     
+    def test_wire_format(self):
+        """Test that frames are nonce || AES-GCM ciphertext+tag, readable by either end"""
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from vpn_client import VPNEncryption as ClientEncryption
+        server_enc = VPNEncryption("test_password")
+        client_enc = ClientEncryption("test_password", salt=server_enc.salt)
+        data = b"interop data"
+        
+        encrypted = server_enc.encrypt(data)
+        iv = encrypted[:VPNProtocol.AES_IV_SIZE]
+        self.assertEqual(AESGCM(server_enc.key).decrypt(iv, encrypted[VPNProtocol.AES_IV_SIZE:], None),
+                         data)
+        self.assertEqual(client_enc.decrypt(encrypted), data)
+        self.assertEqual(server_enc.decrypt(client_enc.encrypt(data)), data)
+    
+    def test_large_payload(self):
+        """Test encryption of payloads large enough to use a preallocated buffer"""
+        encryption = VPNEncryption("test_password")
+        original_data = b"x" * (4 * VPNProtocol.ENCRYPT_INTO_THRESHOLD)
+        
+        encrypted = encryption.encrypt(original_data)
+        self.assertEqual(encryption.decrypt(encrypted), original_data)
+    
+    def test_chacha20_cipher(self):
+        """Test the ChaCha20-Poly1305 fallback cipher"""
+        encryption = VPNEncryption("test_password",
+                                   cipher=VPNProtocol.CIPHER_CHACHA20_POLY1305)
+        data = b"test data"
+        
+        self.assertEqual(encryption.decrypt(encryption.encrypt(data)), data)
+        
+        # AES-GCM with the same key must not accept ChaCha20 ciphertext
+        aes = VPNEncryption("test_password", salt=encryption.salt,
+                            cipher=VPNProtocol.CIPHER_AES_256_GCM)
+        with self.assertRaises(Exception):
+            aes.decrypt(encryption.encrypt(data))
+        
+        with self.assertRaises(ValueError):
+            VPNEncryption("test_password", cipher=0xFF)
+    
     def test_different_passwords(self):
         """Test that different passwords produce different results"""
         data = b"test data"
@@ -80,6 +159,32 @@ class TestVPNEncryption(unittest.TestCase):
         # Should not be able to decrypt with different password
         with self.assertRaises(Exception):
             enc2.decrypt(encrypted1)
+    
+    def test_shared_salt(self):
+        """Test that the same password and salt derive the same key"""
+        enc1 = VPNEncryption("password1")
+        enc2 = VPNEncryption("password1", salt=enc1.salt)
+        
+        self.assertEqual(enc1.key, enc2.key)
+        self.assertEqual(enc2.decrypt(enc1.encrypt(b"test data")), b"test data")
+    
+    def test_for_password(self):
+        """Test that instances are shared per password and salt"""
+        from vpn_client import VPNEncryption, VPNProtocol  # client-only helpers
+        enc = VPNEncryption.for_password("password1", b"s" * VPNProtocol.SALT_SIZE)
+        
+        self.assertIs(VPNEncryption.for_password("password1", b"s" * VPNProtocol.SALT_SIZE), enc)
+        self.assertIsNot(VPNEncryption.for_password("password2", enc.salt), enc)
+    
+    def test_entropy_pool(self):
+        """Test that pooled random bytes are never handed out twice"""
+        from vpn_server import _EntropyPool
+        pool = _EntropyPool()
+        draws = [pool.draw(16) for _ in range(2 * _EntropyPool.BLOCK_SIZE // 16)]
+        
+        self.assertTrue(all(len(d) == 16 for d in draws))
+        self.assertEqual(len(set(draws)), len(draws))
+        self.assertEqual(len(pool.draw(2 * _EntropyPool.BLOCK_SIZE)), 2 * _EntropyPool.BLOCK_SIZE)
 
 
 class TestVPNServer(unittest.TestCase):
@@ -101,10 +206,171 @@ class TestVPNServer(unittest.TestCase):
         self.server.add_user("testuser", "testpass")
         self.assertIn("testuser", self.server.users)
         self.assertEqual(self.server.users["testuser"], "testpass")
+        self.assertIn("testuser", self.server.user_keys)
         
         # Remove user
         self.server.remove_user("testuser")
         self.assertNotIn("testuser", self.server.users)
+        self.assertNotIn("testuser", self.server.user_keys)
+    
+    def test_handle_auth(self):
+        """Test that auth uses the named user's pre-derived key and salt"""
+        from vpn_server import ClientHandler, _AUTH_STRUCT, _HANDSHAKE_STRUCT, _HANDSHAKE_REPLY_STRUCT
+        auth = _AUTH_STRUCT.pack(int(time.time()), b"user1")
+        
+        for claimed, password, accepted in ((b"user1", "password1", True),
+                                            (b"user1", "wrong", False),
+                                            (b"admin", "admin123", False),  # sealed name differs
+                                            (b"nobody", "password1", False)):
+            handler = ClientHandler(Mock(), Mock(), ("127.0.0.1", 0), self.server.user_keys)
+            handler._handle_handshake(_HANDSHAKE_STRUCT.pack(
+                VPNProtocol.VERSION, VPNProtocol.CIPHER_AES_256_GCM, claimed))
+            _, reply = VPNProtocol.parse_packet(handler.writer.write.call_args.args[0])
+            salt = _HANDSHAKE_REPLY_STRUCT.unpack(reply)[3]
+            client_encryption = VPNEncryption(password, salt=salt)
+            
+            handler._handle_auth(client_encryption.encrypt(auth))
+            self.assertEqual(handler.authenticated, accepted)
+            if accepted:
+                self.assertEqual(handler.username, "user1")
+                self.assertEqual(handler.encryption.key, client_encryption.key)
+                self.assertEqual(handler.encryption.key, self.server.user_keys["user1"][1])
+    
+    def test_handshake_cipher_choice(self):
+        """Test that ChaCha20-Poly1305 is chosen when either end lacks AES acceleration"""
+        from vpn_server import ClientHandler, _HANDSHAKE_STRUCT, _HANDSHAKE_REPLY_STRUCT
+        aes, chacha = VPNProtocol.CIPHER_AES_256_GCM, VPNProtocol.CIPHER_CHACHA20_POLY1305
+        
+        for server_default, proposed, chosen in ((aes, aes, aes), (aes, chacha, chacha),
+                                                 (chacha, aes, chacha)):
+            handler = ClientHandler(Mock(), Mock(), ("127.0.0.1", 0), self.server.user_keys)
+            with patch("vpn_server.DEFAULT_CIPHER", server_default):
+                handler._handle_handshake(_HANDSHAKE_STRUCT.pack(VPNProtocol.VERSION, proposed, b"user1"))
+            _, reply = VPNProtocol.parse_packet(handler.writer.write.call_args.args[0])
+            self.assertEqual(_HANDSHAKE_REPLY_STRUCT.unpack(reply)[2], chosen)
+            self.assertEqual(handler.client_cipher, chosen)
+    
+    def test_handshake_rejected(self):
+        """Test that an unsupported version or cipher gets a failure reply and a hang-up"""
+        from vpn_server import ClientHandler, _HANDSHAKE_STRUCT, _HANDSHAKE_REPLY_STRUCT
+        for version, cipher in ((VPNProtocol.VERSION - 1, VPNProtocol.CIPHER_AES_256_GCM),
+                                (VPNProtocol.VERSION, 0xFF)):
+            handler = ClientHandler(Mock(), Mock(), ("127.0.0.1", 0), self.server.user_keys)
+            handler._handle_handshake(_HANDSHAKE_STRUCT.pack(version, cipher, b"user1"))
+            _, reply = VPNProtocol.parse_packet(handler.writer.write.call_args.args[0])
+            self.assertEqual(_HANDSHAKE_REPLY_STRUCT.unpack(reply)[1], VPNProtocol.HANDSHAKE_REJECTED)
+            self.assertFalse(handler.running)
+    
+    def test_handler_framing(self):
+        """Test that coalesced and split packets are each handled exactly once"""
+        from vpn_server import ClientHandler
+        payloads = [bytes([i]) * 3 for i in range(3)]
+        stream = b"".join(VPNProtocol.create_packet(VPNProtocol.MSG_KEEPALIVE, p) for p in payloads)
+        
+        async def run():
+            reader = asyncio.StreamReader()
+            for chunk in (stream[:-4], stream[-4:]):  # two and a half, then the rest
+                reader.feed_data(chunk)
+            reader.feed_eof()
+            handler = ClientHandler(reader, Mock(drain=AsyncMock(), wait_closed=AsyncMock()),
+                                    ("127.0.0.1", 0), self.server.user_keys)
+            handler.authenticated = True  # pre-auth frames are capped at their struct size
+            await handler.handle()
+        
+        with patch.object(ClientHandler, "_handle_message", new_callable=AsyncMock) as handle_message:
+            asyncio.run(run())
+        self.assertEqual([c.args for c in handle_message.call_args_list],
+                         [(VPNProtocol.MSG_KEEPALIVE, p) for p in payloads])
+    
+    def test_pre_auth_length_limit(self):
+        """Test that an oversized frame before auth is refused without reading its payload"""
+        from vpn_server import ClientHandler
+        
+        async def run(msg_type, length):
+            reader = asyncio.StreamReader()
+            reader.feed_data(VPNProtocol.create_header(msg_type, length))
+            writer = Mock(drain=AsyncMock(), wait_closed=AsyncMock())
+            handler = ClientHandler(reader, writer, ("127.0.0.1", 0), self.server.user_keys)
+            # No payload and no EOF follow, so handle() only returns if it never waits for one
+            await asyncio.wait_for(handler.handle(), 5)
+            writer.close.assert_called_once()
+        
+        with patch.object(ClientHandler, "_handle_message", new_callable=AsyncMock) as handle_message:
+            for msg_type in (VPNProtocol.MSG_HANDSHAKE, VPNProtocol.MSG_AUTH, VPNProtocol.MSG_DATA):
+                asyncio.run(run(msg_type, 1024 * 1024))
+        handle_message.assert_not_called()
+    
+    def test_clients_tracks_live_connections(self):
+        """Test that a handler leaves VPNServer.clients when its connection ends"""
+        server_thread = threading.Thread(target=self.server.start, daemon=True)
+        server_thread.start()
+        self.addCleanup(server_thread.join, 5)
+        self.addCleanup(self.server.stop)
+        time.sleep(0.3)
+        
+        def wait_for_clients(count):
+            deadline = time.time() + 5
+            while len(self.server.clients) != count and time.time() < deadline:
+                time.sleep(0.01)
+            return len(self.server.clients)
+        
+        with socket.create_connection(self.server.socket.getsockname()):
+            self.assertEqual(wait_for_clients(1), 1)
+        self.assertEqual(wait_for_clients(0), 0)
+    
+    def test_concurrent_clients(self):
+        """Test that each connected client gets its own flush worker"""
+        server_thread = threading.Thread(target=self.server.start, daemon=True)
+        server_thread.start()
+        self.addCleanup(server_thread.join, 5)
+        self.addCleanup(self.server.stop)
+        time.sleep(0.3)
+        port = self.server.socket.getsockname()[1]
+        
+        clients = [VPNClient("127.0.0.1", port, name, password)
+                   for name, password in (("user1", "password1"), ("user2", "password2"))]
+        for client in clients:
+            self.assertTrue(client.connect())
+            self.addCleanup(client.disconnect)
+        
+        # Small messages wait for the flush worker rather than being sent inline
+        for i, client in enumerate(clients):
+            client.send_data(f"msg{i}".encode())
+        for i, client in enumerate(clients):
+            self.assertEqual(client.receive_data(), f"Echo: msg{i}".encode())
+    
+    def test_logger_deferred_format(self):
+        """Test that %-args are only formatted for messages that pass the level"""
+        lines = []
+        self.addCleanup(setattr, VPNLogger, "sink", None)
+        VPNLogger.sink = lambda level, message: lines.append(f"{level}: {message}")
+        unformattable = Mock(__str__=Mock(side_effect=AssertionError("formatted")))
+        
+        with patch.object(VPNLogger, "min_level", VPNLogger.LEVELS["WARNING"]):
+            VPNLogger.info("Received %s", unformattable)
+            VPNLogger.warning("Client %s: %s", ("127.0.0.1", 0), "gone")
+        self.assertEqual(lines, ["WARNING: Client ('127.0.0.1', 0): gone"])
+    
+    def test_server_commands(self):
+        """Test the command loop used by the GUI's server process"""
+        log_queue, command_queue = queue.Queue(), queue.Queue()
+        self.addCleanup(setattr, VPNLogger, "sink", None)
+        worker = threading.Thread(target=run_server_process,
+                                  args=("127.0.0.1", 0, log_queue, command_queue), daemon=True)
+        worker.start()
+        self.assertTrue(log_queue.get(timeout=5).startswith("SUCCESS: VPN Server started"))
+        
+        command_queue.put(("add_user", "testuser", "testpass"))
+        command_queue.put(("stop",))
+        worker.join(timeout=5)
+        
+        # stop is called from the command thread and must end the server's event loop
+        self.assertFalse(worker.is_alive())
+        lines = []
+        while not log_queue.empty():
+            lines.append(log_queue.get())
+        self.assertIn("INFO: User testuser added", lines)
+        self.assertIn("INFO: VPN Server stopped", lines)
 
 
 class TestVPNClient(unittest.TestCase):
@@ -119,6 +385,60 @@ class TestVPNClient(unittest.TestCase):
         self.assertEqual(client.username, "testuser")
         self.assertEqual(client.password, "testpass")
         self.assertFalse(client.connected)
+    
+    def test_feed(self):
+        """Test reassembling packets from raw socket reads"""
+        client = VPNClient("localhost", 8080, "testuser", "testpass")
+        client.encryption = VPNEncryption("testpass")
+        body = VPNProtocol.pack_record(b"one") + VPNProtocol.pack_record(b"two")
+        stream = (VPNProtocol.create_packet(VPNProtocol.MSG_KEEPALIVE) +
+                  VPNProtocol.create_packet(VPNProtocol.MSG_DATA,
+                                            client.encryption.encrypt(body)))
+        
+        # A packet split across reads is only returned once complete
+        self.assertEqual(client.feed(stream[:-5]), [])
+        self.assertEqual(client.feed(stream[-5:]), [b"one", b"two"])
+        self.assertEqual(client.feed(b""), [])
+    
+    def test_keepalive_during_flush(self):
+        """Test that keep-alives sent mid-flush don't split the data frame"""
+        from vpn_client import _PKT_KEEPALIVE
+        
+        class TrickleSocket:
+            """Accepts at most 4 KiB per send, like a full socket buffer would"""
+            def __init__(self):
+                self.sent = bytearray()
+                self.keepalives = 0
+            
+            def sendmsg(self, views):
+                time.sleep(0.0005)
+                chunk = bytes(views[0][:4096])
+                self.sent += chunk
+                return len(chunk)
+            
+            def sendall(self, data):
+                self.keepalives += data == _PKT_KEEPALIVE
+                self.sent += data
+        
+        client = VPNClient("localhost", 8080, "testuser", "testpass")
+        client.encryption = VPNEncryption("testpass")
+        client.socket = TrickleSocket()
+        client.connected = True
+        client.KEEPALIVE_INTERVAL = 0.001
+        stop_evt = threading.Event()
+        keepalive = threading.Thread(target=client._keepalive_worker, args=(stop_evt,))
+        keepalive.start()
+        
+        message = bytes(range(256)) * 4096
+        try:
+            client.send_data(message)
+            time.sleep(0.05)
+        finally:
+            stop_evt.set()
+            keepalive.join(5)
+        
+        self.assertGreater(client.socket.keepalives, 0)
+        self.assertEqual(client.feed(bytes(client.socket.sent)), [message])
 
 
 class TestVPNIntegration(unittest.TestCase):
@@ -201,6 +521,71 @@ class TestVPNSecurity(unittest.TestCase):
         # But both should decrypt to same plaintext
         self.assertEqual(encryption.decrypt(encrypted1), data)
         self.assertEqual(encryption.decrypt(encrypted2), data)
+    
+    def test_nonce_counter(self):
+        """Test that nonces share a per-session prefix and never repeat"""
+        encryption = VPNEncryption("password")
+        prefix_size = VPNProtocol.NONCE_PREFIX_SIZE
+        nonces = [encryption.encrypt(b"x")[:VPNProtocol.AES_IV_SIZE] for _ in range(3)]
+        
+        self.assertEqual(len(set(nonces)), 3)
+        self.assertEqual({n[:prefix_size] for n in nonces}, {encryption._nonce_prefix})
+        
+        # Refuse to reuse a nonce once the counter space is exhausted
+        encryption._nonce_counter = iter([1 << (8 * (VPNProtocol.AES_IV_SIZE - prefix_size))])
+        with self.assertRaises(RuntimeError):
+            encryption.encrypt(b"x")
+
+
+
+class TestVPNServerLocation(unittest.TestCase):
+    """Test the server catalog and its cached views"""
+    
+    def setUp(self):
+        self.locations = VPNServerLocation()
+    
+    def test_load_update_refreshes_caches(self):
+        """Test that a load update rebuilds stats, labels and pings"""
+        locations = self.locations
+        stats = locations.get_location_stats()
+        rows = locations.formatted_stats()
+        locations.get_server_labels("Japan")
+        self.assertIs(locations.get_location_stats(), stats)
+        self.assertIs(locations.formatted_stats(), rows)
+        
+        with patch.object(locations, "simulate_ping", return_value=1):
+            locations._update_server_loads()
+        self.assertIsNot(locations.get_location_stats(), stats)
+        self.assertIsNot(locations.formatted_stats(), rows)
+        
+        # Pings are re-measured up front, and labels show the current load and ping
+        self.assertEqual(locations._ping_cache,
+                         {server.ip: 1 for server in locations._servers_flat})
+        for server, label in zip(locations.get_servers_by_country("Japan"),
+                                 locations.get_server_labels("Japan")):
+            self.assertIn(f"({server.load}% load, {locations.get_ping(server.ip)}ms)", label)
+    
+    def test_load_bookkeeping(self):
+        """Test that per-country totals and best servers track the loads"""
+        locations = self.locations
+        for _ in range(50):
+            locations._update_server_loads()
+            
+            self.assertEqual(list(locations._loads), [s.load for s in locations._servers_flat])
+            stats = locations.get_location_stats()
+            for country in locations.get_countries():
+                servers = locations.get_servers_by_country(country)
+                loads = [server.load for server in servers]
+                self.assertTrue(all(10 <= load <= 90 for load in loads))
+                self.assertEqual(locations._country_meta[country]["sum"], sum(loads))
+                self.assertEqual(stats[country]["avg_load"], round(sum(loads) / len(loads), 1))
+                self.assertIs(locations.get_best_server(country)[1],
+                              min(servers, key=lambda server: server.load))
+            
+            best = min(((country, server) for country in locations.get_countries()
+                        for server in locations.get_servers_by_country(country)),
+                       key=lambda pair: pair[1].load)
+            self.assertEqual(locations.get_best_server(), best)
 
 
 if __name__ == "__main__":
@@ -214,6 +599,7 @@ if __name__ == "__main__":
         TestVPNServer,
         TestVPNClient,
         TestVPNSecurity,
+        TestVPNServerLocation,
         # TestVPNIntegration,  # Skip integration tests by default
     ]
     
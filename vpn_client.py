@@ -4,18 +4,16 @@ import struct
 import socket
 import threading
 import time
-import json
-import base64
-import hashlib
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+import functools
+import hmac
+import itertools
+import platform
+import selectors
+from collections import deque
+from typing import List, Optional, Tuple, Union
 
 try:
-    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-    from cryptography.hazmat.backends import default_backend
-    from cryptography.hazmat.primitives import hashes, serialization
-    from cryptography.hazmat.primitives.asymmetric import rsa, padding
-    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 except ImportError:
     print("Error: cryptography library not found. Install with: pip install cryptography")
     sys.exit(1)
@@ -31,12 +29,48 @@ except ImportError:
         BRIGHT = DIM = RESET_ALL = ""
 
 
+# socket.sendmsg doesn't exist on Windows; send_packet falls back to sendall there
+_HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+# Packet header: magic, version, message type, payload length
+_HDR_STRUCT = struct.Struct('!4sBBI')
+_HDR_SIZE = _HDR_STRUCT.size
+
+# Handshake request: client version, cipher id, username as a pascal string (up to 31 bytes)
+_HANDSHAKE_STRUCT = struct.Struct('!BB32p')
+# Handshake reply: server version, status, accepted cipher id, the user's 16-byte key salt
+_HANDSHAKE_REPLY_STRUCT = struct.Struct('!BBB16s')
+# Encrypted auth body: timestamp, username as a pascal string (up to 31 bytes)
+_AUTH_STRUCT = struct.Struct('!Q32p')
+
+
+def _has_aes_acceleration() -> bool:
+    """Best-effort check for hardware AES and carry-less multiply (GCM's fast path)"""
+    machine = platform.machine().lower()
+    if sys.platform == 'darwin' and machine in ('arm64', 'aarch64'):
+        return True  # Apple silicon always has the ARMv8 crypto extensions
+    
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpuinfo = f.read()
+    except OSError:
+        # No cpuinfo to inspect; every x86-64 CPU of the last decade has AES-NI
+        return machine in ('x86_64', 'amd64')
+    
+    flags = set()
+    for line in cpuinfo.splitlines():
+        key, _, value = line.partition(':')
+        if key.strip() in ('flags', 'Features'):
+            flags.update(value.split())
+    return 'aes' in flags and ('pclmulqdq' in flags or 'pmull' in flags)
+
+
 class VPNProtocol:
     """VPN Protocol constants and utilities"""
     
     # Protocol constants
     MAGIC_BYTES = b'\xDE\xAD\xBE\xEF'
-    VERSION = 1
+    VERSION = 4  # 3: struct handshake reply; 4: username in handshake, server-held salts
     
     # Message types
     MSG_HANDSHAKE = 0x01
@@ -47,128 +81,350 @@ class VPNProtocol:
     MSG_AUTH_SUCCESS = 0x06
     MSG_AUTH_FAILURE = 0x07
     
-    # Encryption settings
+    # AEAD ciphers; both use 256-bit keys, 96-bit nonces and 128-bit tags
+    CIPHER_AES_256_GCM = 0x01
+    CIPHER_CHACHA20_POLY1305 = 0x02
+    CIPHERS = {
+        CIPHER_AES_256_GCM: AESGCM,
+        CIPHER_CHACHA20_POLY1305: ChaCha20Poly1305,
+    }
+    
+    # Encryption settings (the AES_* sizes apply to ChaCha20-Poly1305 as well)
     AES_KEY_SIZE = 32  # 256-bit
-    AES_IV_SIZE = 16   # 128-bit
+    AES_IV_SIZE = 12   # 96-bit, the GCM standard nonce size
+    AES_TAG_SIZE = 16  # 128-bit
+    NONCE_PREFIX_SIZE = 8  # random per key holder; the rest of the IV is a counter
+    KDF_ITERATIONS = 100000
+    SALT_SIZE = 16
+    MAX_USERNAME_LENGTH = 31  # bytes, UTF-8 encoded
+    HANDSHAKE_OK = 0
+    HANDSHAKE_REJECTED = 1  # unsupported version or cipher; the server then hangs up
+    # Below this size a fresh ciphertext + concat is cheaper than filling a buffer
+    ENCRYPT_INTO_THRESHOLD = 1024
+    
+    # Payloads at least this large are sent without copying them behind the header
+    SEND_COPY_THRESHOLD = 16 * 1024
+    
+    # Frames announcing a bigger payload are rejected before any of it is read
+    MAX_PAYLOAD = 16 * 1024 * 1024
+    # Largest single send_data() message; leaves room for batching and the echo
+    MAX_MESSAGE_SIZE = 4 * 1024 * 1024
+    
+    @staticmethod
+    def create_header(msg_type: int, length: int) -> bytes:
+        """Create the header for a packet carrying `length` payload bytes"""
+        return _HDR_STRUCT.pack(VPNProtocol.MAGIC_BYTES, VPNProtocol.VERSION,
+                                msg_type, length)
     
     @staticmethod
     def create_packet(msg_type: int, data: bytes = b'') -> bytes:
         """Create a VPN protocol packet"""
-        header = struct.pack('!4sBBI', VPNProtocol.MAGIC_BYTES, 
-                           VPNProtocol.VERSION, msg_type, len(data))
-        return header + data
+        return VPNProtocol.create_header(msg_type, len(data)) + data
     
     @staticmethod
-    def parse_packet(data: bytes) -> Tuple[int, bytes]:
-        """Parse a VPN protocol packet"""
-        if len(data) < 10:
-            raise ValueError("Packet too short")
-        
-        magic, version, msg_type, length = struct.unpack('!4sBBI', data[:10])
+    def send_packet(sock: socket.socket, msg_type: int, data: bytes = b''):
+        """Send a complete VPN protocol packet, retrying short writes"""
+        header = VPNProtocol.create_header(msg_type, len(data))
+        if _HAS_SENDMSG and len(data) >= VPNProtocol.SEND_COPY_THRESHOLD:
+            # Kernel gathers header + payload (writev); no user-space concat copy
+            VPNProtocol._sendmsg_all(sock, [header, data])
+        else:
+            sock.sendall(header + data)
+    
+    @staticmethod
+    def _sendmsg_all(sock: socket.socket, buffers: List[bytes]):
+        """Gather-write `buffers` with sendmsg, resuming after short writes"""
+        views = [memoryview(buf) for buf in buffers]
+        while views:
+            sent = sock.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            if sent:
+                views[0] = views[0][sent:]
+    
+    @staticmethod
+    def _unpack_header(data: bytes) -> Tuple[int, int]:
+        """Validate the header at the start of `data`; return (msg_type, payload length)"""
+        magic, version, msg_type, length = _HDR_STRUCT.unpack_from(data, 0)
         
-        if magic != VPNProtocol.MAGIC_BYTES:
+        if not hmac.compare_digest(magic, VPNProtocol.MAGIC_BYTES):
             raise ValueError("Invalid magic bytes")
         
         if version != VPNProtocol.VERSION:
             raise ValueError(f"Unsupported version: {version}")
         
-        if len(data) < 10 + length:
+        if length > VPNProtocol.MAX_PAYLOAD:
+            raise ValueError(f"Oversized packet: {length} bytes")
+        
+        return msg_type, length
+    
+    @staticmethod
+    def parse_packet(data: bytes) -> Tuple[int, bytes]:
+        """Parse a VPN protocol packet"""
+        if len(data) < _HDR_SIZE:
+            raise ValueError("Packet too short")
+        
+        msg_type, length = VPNProtocol._unpack_header(data)
+        
+        if len(data) < _HDR_SIZE + length:
             raise ValueError("Incomplete packet")
         
-        payload = data[10:10+length]
+        payload = data[_HDR_SIZE:_HDR_SIZE + length]
         return msg_type, payload
+    
+    @staticmethod
+    def pack_record(data: bytes) -> bytes:
+        """Length-prefix a message so several can share one MSG_DATA frame"""
+        return len(data).to_bytes(4, 'big') + data
+    
+    @staticmethod
+    def unpack_records(data: bytes) -> List[bytes]:
+        """Split a decrypted MSG_DATA body back into its messages"""
+        records = []
+        offset = 0
+        while offset < len(data):
+            if offset + 4 > len(data):
+                raise ValueError("Truncated record header")
+            length = int.from_bytes(data[offset:offset + 4], 'big')
+            offset += 4
+            if offset + length > len(data):
+                raise ValueError("Truncated record")
+            records.append(data[offset:offset + length])
+            offset += length
+        return records
+
+
+# Software AES-GCM is slower than ChaCha20-Poly1305 and not constant-time
+DEFAULT_CIPHER = (VPNProtocol.CIPHER_AES_256_GCM if _has_aes_acceleration()
+                  else VPNProtocol.CIPHER_CHACHA20_POLY1305)
+
+# Payload-free control packets never change, so they are built once
+_PKT_KEEPALIVE = VPNProtocol.create_packet(VPNProtocol.MSG_KEEPALIVE)
+_PKT_DISCONNECT = VPNProtocol.create_packet(VPNProtocol.MSG_DISCONNECT)
+
+
+class _EntropyPool:
+    """Hands out os.urandom bytes from a 4 KiB block, one syscall per block"""
+    
+    BLOCK_SIZE = 4096
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        """Drop buffered bytes; a forked child must never reuse its parent's"""
+        self._lock = threading.Lock()
+        self._buf = b''
+        self._pos = 0
+    
+    def draw(self, n: int) -> bytes:
+        with self._lock:
+            if len(self._buf) - self._pos < n:
+                self._buf = os.urandom(max(n, self.BLOCK_SIZE))
+                self._pos = 0
+            out = self._buf[self._pos:self._pos + n]
+            self._pos += n
+        return out
+
+
+_ENTROPY = _EntropyPool()
+if hasattr(os, 'register_at_fork'):  # POSIX only
+    os.register_at_fork(after_in_child=_ENTROPY.reset)
+
+
+@functools.lru_cache(maxsize=1024)
+def _derive_key_cached(password: bytes, salt: bytes, iterations: int, length: int) -> bytes:
+    """Derive a key with PBKDF2, memoized per (password, salt)"""
+    # Imported on first use; the KDF only runs once per session
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=length,
+        salt=salt,
+        iterations=iterations,
+    )
+    return kdf.derive(password)
 
 
 class VPNEncryption:
     """Handles encryption/decryption for VPN traffic"""
     
-    def __init__(self, password: str):
+    # One instance per session; slots keep it small and its hot attributes fast
+    __slots__ = ('password', 'salt', 'cipher', 'key', '_aead', '_encrypt_into',
+                 '_nonce_prefix', '_nonce_counter')
+    
+    def __init__(self, password: str, salt: Optional[bytes] = None,
+                 cipher: int = DEFAULT_CIPHER):
+        if cipher not in VPNProtocol.CIPHERS:
+            raise ValueError(f"Unsupported cipher: {cipher}")
+        
         self.password = password.encode()
-        self.salt = os.urandom(16)
-        self.key = self._derive_key()
+        self.salt = salt if salt is not None else _ENTROPY.draw(VPNProtocol.SALT_SIZE)
+        self._setup(self._derive_key(), cipher)
+    
+    @classmethod
+    def from_key(cls, key: bytes, salt: bytes, cipher: int = DEFAULT_CIPHER) -> 'VPNEncryption':
+        """Wrap an already derived key; PBKDF2 is skipped and no password is kept"""
+        if cipher not in VPNProtocol.CIPHERS:
+            raise ValueError(f"Unsupported cipher: {cipher}")
+        
+        encryption = cls.__new__(cls)
+        encryption.password = None
+        encryption.salt = salt
+        encryption._setup(key, cipher)
+        return encryption
+    
+    def _setup(self, key: bytes, cipher: int):
+        """Create the AEAD context and nonce state for key"""
+        self.cipher = cipher
+        self.key = key
+        self._aead = VPNProtocol.CIPHERS[cipher](self.key)
+        # encrypt_into is only available in newer cryptography releases
+        self._encrypt_into = getattr(self._aead, 'encrypt_into', None)
+        # GCM nonces must be unique per key but need not be unpredictable
+        self._nonce_prefix = _ENTROPY.draw(VPNProtocol.NONCE_PREFIX_SIZE)
+        self._nonce_counter = itertools.count(1)
+    
+    @classmethod
+    @functools.lru_cache(maxsize=32)
+    def for_password(cls, password: str, salt: bytes,
+                     cipher: int = DEFAULT_CIPHER) -> 'VPNEncryption':
+        """Return a shared instance per (password, salt, cipher)
+        
+        Reuses the derived key and AEAD context across reconnects; the
+        nonce counter carries on, so nonces stay unique under the key.
+        """
+        return cls(password, salt=salt, cipher=cipher)
         
     def _derive_key(self) -> bytes:
         """Derive encryption key from password"""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=VPNProtocol.AES_KEY_SIZE,
-            salt=self.salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        return kdf.derive(self.password)
-    
-    def encrypt(self, data: bytes) -> bytes:
-        """Encrypt data using AES-256-GCM"""
-        iv = os.urandom(VPNProtocol.AES_IV_SIZE)
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.GCM(iv),
-            backend=default_backend()
-        )
-        encryptor = cipher.encryptor()
-        ciphertext = encryptor.update(data) + encryptor.finalize()
-        return iv + encryptor.tag + ciphertext
+        return _derive_key_cached(self.password, self.salt,
+                                  VPNProtocol.KDF_ITERATIONS,
+                                  VPNProtocol.AES_KEY_SIZE)
+    
+    def _next_nonce(self) -> bytes:
+        """Return the next prefix + counter nonce, refusing to wrap around"""
+        counter_size = VPNProtocol.AES_IV_SIZE - VPNProtocol.NONCE_PREFIX_SIZE
+        counter = next(self._nonce_counter)  # itertools.count is thread-safe
+        if counter >= 1 << (8 * counter_size):
+            raise RuntimeError("Nonce space exhausted; a new session key is required")
+        return self._nonce_prefix + counter.to_bytes(counter_size, 'big')
+    
+    def encrypt(self, data: bytes) -> Union[bytes, bytearray]:
+        """Encrypt data with the session AEAD (AES-256-GCM or ChaCha20-Poly1305)
+        
+        Payloads of ENCRYPT_INTO_THRESHOLD bytes or more come back as the
+        bytearray they were encrypted into; wrap them in bytes() before
+        hashing one or using it as a dict key.
+        """
+        iv = self._next_nonce()
+        if self._encrypt_into and len(data) >= VPNProtocol.ENCRYPT_INTO_THRESHOLD:
+            # Write iv + ciphertext + tag into one buffer instead of concatenating
+            out = bytearray(VPNProtocol.AES_IV_SIZE + len(data) + VPNProtocol.AES_TAG_SIZE)
+            out[:VPNProtocol.AES_IV_SIZE] = iv
+            self._encrypt_into(iv, data, None, memoryview(out)[VPNProtocol.AES_IV_SIZE:])
+            return out
+        # The AEAD appends the authentication tag to the ciphertext
+        return iv + self._aead.encrypt(iv, data, None)
     
     def decrypt(self, data: bytes) -> bytes:
-        """Decrypt data using AES-256-GCM"""
-        if len(data) < VPNProtocol.AES_IV_SIZE + 16:
+        """Decrypt data with the session AEAD"""
+        if len(data) < VPNProtocol.AES_IV_SIZE + VPNProtocol.AES_TAG_SIZE:
             raise ValueError("Invalid encrypted data")
         
         iv = data[:VPNProtocol.AES_IV_SIZE]
-        tag = data[VPNProtocol.AES_IV_SIZE:VPNProtocol.AES_IV_SIZE + 16]
-        ciphertext = data[VPNProtocol.AES_IV_SIZE + 16:]
-        
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.GCM(iv, tag),
-            backend=default_backend()
-        )
-        decryptor = cipher.decryptor()
-        return decryptor.update(ciphertext) + decryptor.finalize()
+        return self._aead.decrypt(iv, data[VPNProtocol.AES_IV_SIZE:], None)
 
 
 class VPNLogger:
     """Simple logging utility for VPN"""
     
+    # Messages below LOG_LEVEL (environment variable, default INFO) are dropped
+    LEVELS = {"INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40}
+    min_level = LEVELS.get(os.environ.get("LOG_LEVEL", "INFO").upper(), 20)
+    
+    # Formatted timestamp, regenerated at most once per second
+    _last_ts_sec = 0
+    _last_ts_str = ""
+    
+    # Optional callable(level, message) that replaces stdout, e.g. to feed a GUI log
+    sink = None
+    
+    @staticmethod
+    def enabled(level: str) -> bool:
+        """Whether a message at level would be emitted"""
+        return VPNLogger.LEVELS.get(level, 0) >= VPNLogger.min_level
+    
     @staticmethod
-    def log(level: str, message: str, color: str = ""):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def log(level: str, message: str, color: str = "", args: tuple = ()):
+        if VPNLogger.LEVELS.get(level, 0) < VPNLogger.min_level:
+            return
+        if args:
+            message = message % args  # only formatted once the level check passes
+        if VPNLogger.sink is not None:
+            VPNLogger.sink(level, message)
+            return
+        
+        sec = int(time.time())
+        if sec != VPNLogger._last_ts_sec:
+            VPNLogger._last_ts_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+            VPNLogger._last_ts_sec = sec
+        timestamp = VPNLogger._last_ts_str
+        
         if color:
-            print(f"{color}[{timestamp}] {level}: {message}{Style.RESET_ALL}")
+            sys.stdout.write(f"{color}[{timestamp}] {level}: {message}{Style.RESET_ALL}\n")
         else:
-            print(f"[{timestamp}] {level}: {message}")
+            sys.stdout.write(f"[{timestamp}] {level}: {message}\n")
     
     @staticmethod
-    def info(message: str):
-        VPNLogger.log("INFO", message, Fore.CYAN)
+    def info(message: str, *args):
+        VPNLogger.log("INFO", message, Fore.CYAN, args)
     
     @staticmethod
-    def success(message: str):
-        VPNLogger.log("SUCCESS", message, Fore.GREEN)
+    def success(message: str, *args):
+        VPNLogger.log("SUCCESS", message, Fore.GREEN, args)
     
     @staticmethod
-    def warning(message: str):
-        VPNLogger.log("WARNING", message, Fore.YELLOW)
+    def warning(message: str, *args):
+        VPNLogger.log("WARNING", message, Fore.YELLOW, args)
     
     @staticmethod
-    def error(message: str):
-        VPNLogger.log("ERROR", message, Fore.RED)
+    def error(message: str, *args):
+        VPNLogger.log("ERROR", message, Fore.RED, args)
 
 
 class VPNClient:
     """VPN Client implementation"""
     
+    # Send batching: queued messages are coalesced into one encrypted frame
+    SEND_BATCH_SIZE = 32 * 1024  # flush immediately once this much is queued
+    SEND_FLUSH_DELAY = 0.001     # otherwise flush 1 ms after the first write
+    KEEPALIVE_INTERVAL = 30
+    RECV_SIZE = 64 * 1024
+    STOP_POLL_INTERVAL = 1  # seconds the idle flush worker waits before re-checking stop
+    
     def __init__(self, server_host: str, server_port: int, username: str, password: str):
         self.server_host = server_host
         self.server_port = server_port
         self.username = username
         self.password = password
         self.socket = None
+        self._recv_buf = bytearray()  # raw bytes not yet forming a whole packet
+        self._chunk_view = memoryview(bytearray(self.RECV_SIZE))  # reused by read_chunk
         self.encryption = None
         self.connected = False
         self.running = False
         
+        self._send_buf: List[bytes] = []
+        self._send_buf_size = 0
+        self._send_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._stop_evt = threading.Event()
+        self._recv_queue = deque()
+        
     def connect(self) -> bool:
         """Connect to VPN server"""
         try:
@@ -178,11 +434,12 @@ class VPNClient:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.settimeout(10)
             self.socket.connect((self.server_host, self.server_port))
+            # Keepalives and interactive messages are tiny; don't let Nagle hold them
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self._recv_buf.clear()
             
-            # Initialize encryption
-            self.encryption = VPNEncryption(self.password)
-            
-            # Perform handshake
+            # Perform handshake; it also sets up encryption with the salt the server sends
             if not self._handshake():
                 return False
             
@@ -194,9 +451,10 @@ class VPNClient:
             self.running = True
             VPNLogger.success("Connected to VPN server!")
             
-            # Start keep-alive thread
-            keepalive_thread = threading.Thread(target=self._keepalive_worker, daemon=True)
-            keepalive_thread.start()
+            # Fresh event per connection so workers of a previous one still stop
+            self._stop_evt = threading.Event()
+            for worker in (self._keepalive_worker, self._flush_worker):
+                threading.Thread(target=worker, args=(self._stop_evt,), daemon=True).start()
             
             return True
             
@@ -207,20 +465,32 @@ class VPNClient:
     def _handshake(self) -> bool:
         """Perform initial handshake"""
         try:
+            username = self.username.encode()
+            if len(username) > VPNProtocol.MAX_USERNAME_LENGTH:
+                VPNLogger.error(f"Username longer than {VPNProtocol.MAX_USERNAME_LENGTH} bytes")
+                return False
+            
             # Send handshake
-            handshake_data = json.dumps({
-                'client_version': VPNProtocol.VERSION,
-                'encryption_salt': base64.b64encode(self.encryption.salt).decode()
-            }).encode()
+            handshake_data = _HANDSHAKE_STRUCT.pack(VPNProtocol.VERSION, DEFAULT_CIPHER, username)
             
-            packet = VPNProtocol.create_packet(VPNProtocol.MSG_HANDSHAKE, handshake_data)
-            self.socket.send(packet)
+            VPNProtocol.send_packet(self.socket, VPNProtocol.MSG_HANDSHAKE, handshake_data)
             
             # Receive response
-            response = self.socket.recv(1024)
-            msg_type, payload = VPNProtocol.parse_packet(response)
+            msg_type, payload = self._recv_packet()
             
             if msg_type == VPNProtocol.MSG_HANDSHAKE:
+                server_version, status, cipher, salt = _HANDSHAKE_REPLY_STRUCT.unpack(payload)
+                if status == VPNProtocol.HANDSHAKE_REJECTED:
+                    VPNLogger.error("Server rejected the handshake (unsupported version or cipher)")
+                    return False
+                
+                # The server may pick another cipher than proposed, e.g. if it lacks AES-NI
+                if status != VPNProtocol.HANDSHAKE_OK or cipher not in VPNProtocol.CIPHERS:
+                    VPNLogger.error("Server did not agree on a cipher")
+                    return False
+                
+                # The server keeps one salt per user, so reconnects reuse the derived key
+                self.encryption = VPNEncryption.for_password(self.password, salt, cipher)
                 VPNLogger.info("Handshake successful")
                 return True
             else:
@@ -235,18 +505,13 @@ class VPNClient:
         """Authenticate with server"""
         try:
             # Send authentication
-            auth_data = json.dumps({
-                'username': self.username,
-                'timestamp': int(time.time())
-            }).encode()
+            auth_data = _AUTH_STRUCT.pack(int(time.time()), self.username.encode())
             
             encrypted_auth = self.encryption.encrypt(auth_data)
-            packet = VPNProtocol.create_packet(VPNProtocol.MSG_AUTH, encrypted_auth)
-            self.socket.send(packet)
+            VPNProtocol.send_packet(self.socket, VPNProtocol.MSG_AUTH, encrypted_auth)
             
             # Receive response
-            response = self.socket.recv(1024)
-            msg_type, payload = VPNProtocol.parse_packet(response)
+            msg_type, payload = self._recv_packet()
             
             if msg_type == VPNProtocol.MSG_AUTH_SUCCESS:
                 VPNLogger.success("Authentication successful")
@@ -262,49 +527,137 @@ class VPNClient:
             VPNLogger.error(f"Authentication error: {e}")
             return False
     
-    def _keepalive_worker(self):
-        """Send keep-alive messages"""
-        while self.running and self.connected:
+    def _keepalive_worker(self, stop_evt: threading.Event):
+        """Send keep-alive messages until the connection is stopped"""
+        while not stop_evt.wait(self.KEEPALIVE_INTERVAL):
             try:
-                time.sleep(30)  # Send keep-alive every 30 seconds
-                if self.running:
-                    packet = VPNProtocol.create_packet(VPNProtocol.MSG_KEEPALIVE)
-                    self.socket.send(packet)
+                with self._send_lock:  # never between the pieces of a flushed batch
+                    self.socket.sendall(_PKT_KEEPALIVE)
             except:
                 break
     
+    def _flush_worker(self, stop_evt: threading.Event):
+        """Flush queued data shortly after the first write of a batch"""
+        while not stop_evt.is_set():
+            if not self._flush_event.wait(self.STOP_POLL_INTERVAL):
+                continue
+            self._flush_event.clear()
+            if stop_evt.is_set():
+                break
+            time.sleep(self.SEND_FLUSH_DELAY)
+            try:
+                self.flush()
+            except Exception:
+                break
+    
     def send_data(self, data: bytes):
-        """Send data through VPN tunnel"""
+        """Send data through VPN tunnel
+        
+        Messages are queued and coalesced into a single encrypted frame,
+        sent once SEND_BATCH_SIZE bytes are pending or SEND_FLUSH_DELAY
+        has passed.
+        """
         if not self.connected:
             raise RuntimeError("Not connected to VPN server")
+        if len(data) > VPNProtocol.MAX_MESSAGE_SIZE:
+            raise ValueError(f"Message larger than {VPNProtocol.MAX_MESSAGE_SIZE} bytes")
         
-        try:
-            encrypted_data = self.encryption.encrypt(data)
-            packet = VPNProtocol.create_packet(VPNProtocol.MSG_DATA, encrypted_data)
-            self.socket.send(packet)
-        except Exception as e:
-            VPNLogger.error(f"Failed to send data: {e}")
-            raise
+        with self._send_lock:
+            self._send_buf.append(VPNProtocol.pack_record(data))
+            self._send_buf_size += 4 + len(data)
+            if self._send_buf_size < self.SEND_BATCH_SIZE:
+                self._flush_event.set()
+                return
+        
+        self.flush()
+    
+    def flush(self):
+        """Encrypt all queued data into one MSG_DATA frame and send it"""
+        with self._send_lock:
+            if not self._send_buf:
+                return
+            
+            batch = b''.join(self._send_buf)
+            self._send_buf.clear()
+            self._send_buf_size = 0
+            
+            try:
+                encrypted_data = self.encryption.encrypt(batch)
+                VPNProtocol.send_packet(self.socket, VPNProtocol.MSG_DATA, encrypted_data)
+            except Exception as e:
+                VPNLogger.error(f"Failed to send data: {e}")
+                raise
+    
+    def _next_packet(self) -> Optional[Tuple[int, bytes]]:
+        """Pop one complete packet off the receive buffer, or None if incomplete"""
+        if len(self._recv_buf) < _HDR_SIZE:
+            return None
+        
+        msg_type, length = VPNProtocol._unpack_header(self._recv_buf)
+        end = _HDR_SIZE + length
+        if len(self._recv_buf) < end:
+            return None
+        
+        payload = bytes(self._recv_buf[_HDR_SIZE:end])
+        del self._recv_buf[:end]
+        return msg_type, payload
+    
+    def _recv_packet(self) -> Tuple[int, bytes]:
+        """Block until a complete packet has been received"""
+        while True:
+            packet = self._next_packet()
+            if packet:
+                return packet
+            
+            chunk = self.read_chunk()
+            if not chunk:
+                raise ConnectionError("Connection closed by peer")
+            self._recv_buf += chunk
+    
+    def read_chunk(self) -> memoryview:
+        """Read what the socket has into a reused buffer; empty means closed
+        
+        The view is only valid until the next call; pass it to feed() or copy it.
+        """
+        return self._chunk_view[:self.socket.recv_into(self._chunk_view)]
+    
+    def _open_packet(self, msg_type: int, payload: bytes) -> List[bytes]:
+        """Return the messages carried by a received packet"""
+        if msg_type == VPNProtocol.MSG_DATA:
+            return VPNProtocol.unpack_records(self.encryption.decrypt(payload))
+        if msg_type != VPNProtocol.MSG_KEEPALIVE:
+            VPNLogger.warning(f"Unexpected message type: {msg_type}")
+        return []
+    
+    def feed(self, data: Union[bytes, memoryview]) -> List[bytes]:
+        """Consume bytes read from the socket by the caller
+        
+        For event loops that watch the socket themselves: returns the
+        messages of every packet completed by `data` (possibly none).
+        """
+        self._recv_buf += data
+        messages = []
+        packet = self._next_packet()
+        while packet:
+            messages.extend(self._open_packet(*packet))
+            packet = self._next_packet()
+        return messages
     
     def receive_data(self) -> bytes:
         """Receive data from VPN tunnel"""
         if not self.connected:
             raise RuntimeError("Not connected to VPN server")
         
+        # Messages left over from a batched frame are delivered first
+        if self._recv_queue:
+            return self._recv_queue.popleft()
+        
         try:
-            response = self.socket.recv(4096)
-            if not response:
-                raise ConnectionError("Connection closed by server")
-            
-            msg_type, payload = VPNProtocol.parse_packet(response)
-            
-            if msg_type == VPNProtocol.MSG_DATA:
-                return self.encryption.decrypt(payload)
-            elif msg_type == VPNProtocol.MSG_KEEPALIVE:
+            records = self._open_packet(*self._recv_packet())
+            if not records:
                 return b''  # Keep-alive, no data
-            else:
-                VPNLogger.warning(f"Unexpected message type: {msg_type}")
-                return b''
+            self._recv_queue.extend(records[1:])
+            return records[0]
                 
         except Exception as e:
             VPNLogger.error(f"Failed to receive data: {e}")
@@ -314,13 +667,16 @@ class VPNClient:
         """Disconnect from VPN server"""
         if self.connected:
             try:
-                packet = VPNProtocol.create_packet(VPNProtocol.MSG_DISCONNECT)
-                self.socket.send(packet)
+                self.flush()
+                with self._send_lock:
+                    self.socket.sendall(_PKT_DISCONNECT)
             except:
                 pass
         
         self.running = False
         self.connected = False
+        self._stop_evt.set()
+        self._flush_event.set()  # wake the flush worker so it sees the stop
         
         if self.socket:
             self.socket.close()
@@ -335,28 +691,90 @@ class VPNClient:
         try:
             VPNLogger.info("VPN tunnel established. Type 'quit' to disconnect.")
             
+            if sys.platform == 'win32':
+                # select() only accepts sockets on Windows, not stdin
+                self._run_blocking_loop()
+            else:
+                self._run_select_loop()
+        
+        finally:
+            self.disconnect()
+    
+    def _run_select_loop(self):
+        """Wait on stdin and the socket together so server pushes show up at once"""
+        stdin_fd = sys.stdin.fileno()
+        pending = b''
+        sel = selectors.DefaultSelector()
+        sel.register(stdin_fd, selectors.EVENT_READ, 'stdin')
+        sel.register(self.socket, selectors.EVENT_READ, 'sock')
+        
+        try:
+            # Data that arrived together with the auth reply
+            self._show_messages(self.feed(b''))
+            self._prompt()
+            
             while self.running:
-                try:
-                    # Simple echo test
-                    message = input("Enter message to send (or 'quit'): ").strip()
-                    
-                    if message.lower() == 'quit':
-                        break
+                for key, _ in sel.select():
+                    if key.data == 'sock':
+                        data = self.read_chunk()
+                        if not data:
+                            VPNLogger.warning("Server closed the connection")
+                            return
+                        self._show_messages(self.feed(data))
+                        continue
                     
-                    if message:
-                        self.send_data(message.encode())
-                        response = self.receive_data()
-                        if response:
-                            VPNLogger.success(f"Server echo: {response.decode()}")
-                
-                except KeyboardInterrupt:
-                    break
-                except Exception as e:
-                    VPNLogger.error(f"Communication error: {e}")
-                    break
+                    # Raw read: a buffered readline could hide extra lines from select()
+                    data = os.read(stdin_fd, 4096)
+                    if not data:
+                        return
+                    *lines, pending = (pending + data).split(b'\n')
+                    for line in lines:
+                        message = line.strip()
+                        if message.lower() == b'quit':
+                            return
+                        if message:
+                            self.send_data(message)
+                    self._prompt()
         
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            VPNLogger.error(f"Communication error: {e}")
         finally:
-            self.disconnect()
+            sel.close()
+    
+    def _show_messages(self, messages: List[bytes]):
+        """Print the messages received from the server"""
+        for message in messages:
+            if message:
+                VPNLogger.success(f"Server echo: {message.decode()}")
+    
+    @staticmethod
+    def _prompt():
+        sys.stdout.write("Enter message to send (or 'quit'): ")
+        sys.stdout.flush()
+    
+    def _run_blocking_loop(self):
+        """Alternate between input() and receive_data()"""
+        while self.running:
+            try:
+                # Simple echo test
+                message = input("Enter message to send (or 'quit'): ").strip()
+                
+                if message.lower() == 'quit':
+                    break
+                
+                if message:
+                    self.send_data(message.encode())
+                    response = self.receive_data()
+                    if response:
+                        VPNLogger.success(f"Server echo: {response.decode()}")
+            
+            except KeyboardInterrupt:
+                break
+            except Exception as e:
+                VPNLogger.error(f"Communication error: {e}")
+                break
 
 
 if __name__ == "__main__":
@@ -1,36 +1,63 @@
 import os
 import sys
 import socket
+import asyncio
 import threading
 import time
 import json
+import queue
+import multiprocessing
+import selectors
+from collections import deque
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-from typing import Optional
+from tkinter import ttk, messagebox
+from typing import List, Optional, Tuple
 
 # Import VPN components
 try:
     from vpn_client import VPNClient, VPNLogger
-    from vpn_server import VPNServer
-    from vpn_locations import VPNServerLocation
+    from vpn_server import run_server_process
+    from vpn_locations import Server, get_location_manager
+    from vpn_widgets import build_log_frame, build_credential_row
 except ImportError:
     print("Error: VPN modules not found")
     sys.exit(1)
 
 
+# (second, "HH:MM:SS") of the last log line; one tuple so threads never see a mix
+_last_ts = (0, "")
+
+
+def _ts() -> str:
+    """Current time for log lines, formatted at most once per second"""
+    global _last_ts
+    sec = int(time.time())
+    if sec != _last_ts[0]:
+        _last_ts = (sec, time.strftime("%H:%M:%S", time.localtime(sec)))
+    return _last_ts[1]
+
+
 class VPNServerGUI:
     """GUI for VPN Server"""
     
-    def __init__(self):
-        self.root = tk.Tk()
+    LOG_FLUSH_MS = 100  # log lines are batched into one widget update per tick
+    LOG_MAX_LINES = 2000
+    
+    def __init__(self, root: Optional[tk.Tk] = None):
+        self.root = root if root is not None else tk.Tk()
         self.root.title("Fosen VPN Server")
         self.root.geometry("600x500")
         self.root.resizable(True, True)
         
-        self.server: Optional[VPNServer] = None
-        self.server_thread: Optional[threading.Thread] = None
+        # The server runs in its own process so its threads don't share our GIL
+        self.server_process: Optional[multiprocessing.Process] = None
+        self._server_commands = None  # multiprocessing queue of (command, *args)
         self.running = False
-        self.location_manager = VPNServerLocation()
+        self.location_manager = get_location_manager()
+        self._log_queue = deque(maxlen=self.LOG_MAX_LINES)  # older lines would be trimmed anyway
+        self._locations_window: Optional[tk.Toplevel] = None  # built once, then hidden/shown
+        self._locations_tree: Optional[ttk.Treeview] = None
+        self._shown_rows: Optional[list] = None  # rows currently in _locations_tree
         
         self.setup_ui()
         
@@ -58,15 +85,15 @@ class VPNServerGUI:
         
         # Host
         ttk.Label(config_frame, text="Host:").grid(row=0, column=0, sticky=tk.W, padx=(0, 10))
-        self.host_var = tk.StringVar(value="0.0.0.0")
-        host_entry = ttk.Entry(config_frame, textvariable=self.host_var)
-        host_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(0, 10))
+        self.host_entry = ttk.Entry(config_frame)
+        self.host_entry.insert(0, "0.0.0.0")
+        self.host_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(0, 10))
         
         # Port
         ttk.Label(config_frame, text="Port:").grid(row=0, column=2, sticky=tk.W, padx=(10, 10))
-        self.port_var = tk.StringVar(value="8080")
-        port_entry = ttk.Entry(config_frame, textvariable=self.port_var, width=10)
-        port_entry.grid(row=0, column=3, sticky=tk.W)
+        self.port_entry = ttk.Entry(config_frame, width=10)
+        self.port_entry.insert(0, "8080")
+        self.port_entry.grid(row=0, column=3, sticky=tk.W)
         
         # Control buttons
         control_frame = ttk.Frame(main_frame)
@@ -87,28 +114,15 @@ class VPNServerGUI:
         status_label.grid(row=3, column=0, columnspan=3, pady=(0, 10))
         
         # Log area
-        log_frame = ttk.LabelFrame(main_frame, text="Server Log", padding="5")
-        log_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
-        log_frame.columnconfigure(0, weight=1)
-        log_frame.rowconfigure(0, weight=1)
-        
-        self.log_text = scrolledtext.ScrolledText(log_frame, height=15, width=70)
-        self.log_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        _, self.log_text = build_log_frame(main_frame, "Server Log", row=4, height=15)
+        self.root.after(self.LOG_FLUSH_MS, self._flush_log)
         
         # User management
         user_frame = ttk.LabelFrame(main_frame, text="User Management", padding="10")
         user_frame.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(10, 0))
         user_frame.columnconfigure(1, weight=1)
         
-        ttk.Label(user_frame, text="Username:").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
-        self.username_var = tk.StringVar()
-        username_entry = ttk.Entry(user_frame, textvariable=self.username_var)
-        username_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(0, 10))
-        
-        ttk.Label(user_frame, text="Password:").grid(row=0, column=2, sticky=tk.W, padx=(10, 5))
-        self.password_var = tk.StringVar()
-        password_entry = ttk.Entry(user_frame, textvariable=self.password_var, show="*")
-        password_entry.grid(row=0, column=3, sticky=(tk.W, tk.E), padx=(0, 10))
+        self.username_entry, self.password_entry = build_credential_row(user_frame, 0)
         
         add_user_button = ttk.Button(user_frame, text="Add User", command=self.add_user)
         add_user_button.grid(row=0, column=4, padx=(10, 0))
@@ -119,24 +133,46 @@ class VPNServerGUI:
         locations_button.grid(row=1, column=0, columnspan=5, pady=(10, 0), sticky=(tk.W, tk.E))
         
     def log_message(self, message: str):
-        """Add message to log"""
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)
+        """Queue a message for the log; safe to call from any thread"""
+        self._log_queue.append(f"[{_ts()}] {message}\n")
+    
+    def _flush_log(self):
+        """Write all queued log lines with a single insert, then reschedule"""
+        if self._log_queue:
+            lines = [self._log_queue.popleft() for _ in range(len(self._log_queue))]
+            # Only follow new lines if the user hasn't scrolled up to read older ones
+            follow = self.log_text.yview()[1] >= 1.0
+            self.log_text.configure(state=tk.NORMAL)
+            self.log_text.insert(tk.END, "".join(lines))
+            # Keep only the newest lines so memory and redraw cost stay bounded
+            line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1  # text ends in \n
+            excess = line_count - self.LOG_MAX_LINES
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.configure(state=tk.DISABLED)
+            if follow:
+                self.log_text.see(tk.END)
+        self.root.after(self.LOG_FLUSH_MS, self._flush_log)
         
     def start_server(self):
         """Start the VPN server"""
         try:
-            host = self.host_var.get().strip()
-            port = int(self.port_var.get().strip())
+            host = self.host_entry.get().strip()
+            port = int(self.port_entry.get().strip())
             
             if not host:
                 messagebox.showerror("Error", "Host cannot be empty")
                 return
             
-            self.server = VPNServer(host, port)
-            self.server_thread = threading.Thread(target=self._run_server, daemon=True)
-            self.server_thread.start()
+            # spawn: a forked copy of a process running Tk is not safe to use
+            context = multiprocessing.get_context("spawn")
+            log_queue = context.Queue()
+            self._server_commands = context.Queue()
+            self.server_process = context.Process(
+                target=run_server_process, args=(host, port, log_queue, self._server_commands),
+                daemon=True)
+            self.server_process.start()
+            self.root.after(self.LOG_FLUSH_MS, self._drain_server_log, self.server_process, log_queue)
             
             self.start_button.config(state=tk.DISABLED)
             self.stop_button.config(state=tk.NORMAL)
@@ -151,18 +187,27 @@ class VPNServerGUI:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to start server: {e}")
     
-    def _run_server(self):
-        """Run server in separate thread"""
+    def _drain_server_log(self, process: multiprocessing.Process, log_queue):
+        """Move the server process's log lines into the log until it has exited"""
+        alive = process.is_alive()  # checked first so the last lines are still drained
         try:
-            self.server.start()
-        except Exception as e:
-            self.log_message(f"Server error: {e}")
+            while True:
+                self.log_message(log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if alive:
+            self.root.after(self.LOG_FLUSH_MS, self._drain_server_log, process, log_queue)
+        elif process is self.server_process:
+            self.stop_server()  # exited on its own, e.g. the port was taken
     
     def stop_server(self):
         """Stop the VPN server"""
-        if self.server:
-            self.server.stop()
-            self.server = None
+        if self.server_process:
+            self._server_commands.put(("stop",))
+            self.server_process.join(timeout=2)
+            if self.server_process.is_alive():
+                self.server_process.terminate()
+            self.server_process = None
         
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
@@ -173,21 +218,21 @@ class VPNServerGUI:
     
     def add_user(self):
         """Add a new user"""
-        username = self.username_var.get().strip()
-        password = self.password_var.get().strip()
+        username = self.username_entry.get().strip()
+        password = self.password_entry.get().strip()
         
         if not username or not password:
             messagebox.showerror("Error", "Username and password cannot be empty")
             return
         
-        if self.server:
-            self.server.add_user(username, password)
+        if self.server_process:
+            self._server_commands.put(("add_user", username, password))
             self.log_message(f"User '{username}' added")
         else:
             messagebox.showwarning("Warning", "Server not running")
         
-        self.username_var.set("")
-        self.password_var.set("")
+        self.username_entry.delete(0, tk.END)
+        self.password_entry.delete(0, tk.END)
     
     def run(self):
         """Run the GUI"""
@@ -196,10 +241,19 @@ class VPNServerGUI:
     
     def show_locations(self):
         """Show server locations window"""
+        if self._locations_window is not None and self._locations_window.winfo_exists():
+            self._fill_locations_tree(self._locations_tree)
+            self._locations_window.deiconify()
+            self._locations_window.lift()
+            return
+        
         locations_window = tk.Toplevel(self.root)
         locations_window.title("🌍 VPN Server Locations")
         locations_window.geometry("700x500")
         locations_window.resizable(True, True)
+        # Closing only hides the window so the next open skips widget construction
+        locations_window.protocol("WM_DELETE_WINDOW", locations_window.withdraw)
+        self._locations_window = locations_window
         
         # Main frame
         main_frame = ttk.Frame(locations_window, padding="10")
@@ -213,6 +267,8 @@ class VPNServerGUI:
         # Create treeview for locations
         columns = ("Country", "Servers", "Avg Load", "Status")
         tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=15)
+        self._locations_tree = tree
+        self._shown_rows = None
         
         # Configure columns
         tree.heading("Country", text="🌍 Country")
@@ -226,15 +282,7 @@ class VPNServerGUI:
         tree.column("Status", width=150)
         
         # Populate with location data
-        stats = self.location_manager.get_location_stats()
-        for country, data in stats.items():
-            status = "🟢 Excellent" if data["avg_load"] < 30 else "🟡 Good" if data["avg_load"] < 70 else "🔴 Busy"
-            tree.insert("", tk.END, values=(
-                f"{data['flag']} {country}",
-                f"{data['servers']} servers",
-                f"{data['avg_load']}%",
-                status
-            ))
+        self._fill_locations_tree(tree)
         
         # Add scrollbar
         scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=tree.yview)
@@ -255,25 +303,30 @@ class VPNServerGUI:
                                 command=lambda: self.refresh_locations_data(tree))
         refresh_btn.pack(pady=10)
     
-    def refresh_locations_data(self, tree):
+    def refresh_locations_data(self, tree: ttk.Treeview):
         """Refresh locations data in the tree"""
-        # Clear existing data
-        for item in tree.get_children():
-            tree.delete(item)
-        
         # Update server loads
         self.location_manager._update_server_loads()
         
         # Repopulate
-        stats = self.location_manager.get_location_stats()
-        for country, data in stats.items():
-            status = "🟢 Excellent" if data["avg_load"] < 30 else "🟡 Good" if data["avg_load"] < 70 else "🔴 Busy"
-            tree.insert("", tk.END, values=(
-                f"{data['flag']} {country}",
-                f"{data['servers']} servers",
-                f"{data['avg_load']}%",
-                status
-            ))
+        self._fill_locations_tree(tree)
+    
+    def _fill_locations_tree(self, tree: ttk.Treeview):
+        """Show the current location stats, reusing existing rows when possible"""
+        rows = self.location_manager.formatted_stats()
+        if rows == self._shown_rows:
+            return  # loads moved without changing any displayed value
+        self._shown_rows = rows
+        items = tree.get_children()
+        
+        if len(items) == len(rows):
+            # Countries never change, only their values: update rows in place
+            for item, row in zip(items, rows):
+                tree.item(item, values=row)
+        else:
+            tree.delete(*items)
+            for row in rows:
+                tree.insert("", tk.END, values=row)
     
     def on_closing(self):
         """Handle window closing"""
@@ -285,17 +338,36 @@ class VPNServerGUI:
 class VPNClientGUI:
     """GUI for VPN Client"""
     
-    def __init__(self):
-        self.root = tk.Tk()
+    LOG_FLUSH_MS = 100  # log lines are batched into one widget update per tick
+    LOG_MAX_LINES = 2000
+    SELECTION_DEBOUNCE_MS = 150  # arrow-keying through a combobox fires per item
+    UI_POLL_MS = 50
+    
+    def __init__(self, root: Optional[tk.Tk] = None):
+        self.root = root if root is not None else tk.Tk()
         self.root.title("Fosen VPN Client")
         self.root.geometry("800x700")
         self.root.resizable(True, True)
         
         self.client: Optional[VPNClient] = None
         self.connected = False
-        self.location_manager = VPNServerLocation()
+        self.location_manager = get_location_manager()
         self.selected_country = None
         self.selected_server = None
+        # Combobox index -> entity, so selections need no label parsing
+        self._country_by_index: Tuple[str, ...] = ()
+        self._server_by_index: List[Server] = []
+        self._shown_server_labels: Optional[List[str]] = None
+        self._log_queue = deque(maxlen=self.LOG_MAX_LINES)  # older lines would be trimmed anyway
+        self._country_debounce_id: Optional[str] = None
+        self._server_debounce_id: Optional[str] = None
+        
+        # One background event loop does all client socket I/O
+        # add_reader needs a selector loop; DefaultSelector is epoll/kqueue where available
+        self._loop = asyncio.SelectorEventLoop(selectors.DefaultSelector())
+        self._pending_disconnect = None
+        self._ui_queue = queue.SimpleQueue()  # (callback, args) for the Tk thread
+        threading.Thread(target=self._run_loop, daemon=True).start()
         
         self.setup_ui()
     
@@ -359,17 +431,9 @@ class VPNClientGUI:
         config_frame.columnconfigure(1, weight=1)
         config_frame.columnconfigure(3, weight=1)
         
-        # Username
-        ttk.Label(config_frame, text="Username:").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
-        self.username_var = tk.StringVar(value="admin")
-        username_entry = ttk.Entry(config_frame, textvariable=self.username_var)
-        username_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(0, 10))
-        
-        # Password
-        ttk.Label(config_frame, text="Password:").grid(row=0, column=2, sticky=tk.W, padx=(10, 5))
-        self.password_var = tk.StringVar(value="admin123")
-        password_entry = ttk.Entry(config_frame, textvariable=self.password_var, show="*")
-        password_entry.grid(row=0, column=3, sticky=(tk.W, tk.E))
+        # Username / Password
+        self.username_entry, self.password_entry = build_credential_row(
+            config_frame, 0, "admin", "admin123")
         
         # Control buttons
         control_frame = ttk.Frame(main_frame)
@@ -397,41 +461,30 @@ class VPNClientGUI:
                                          font=("Arial", 9))
         connection_info_label.pack()
         
-        # Communication area
-        comm_frame = ttk.LabelFrame(main_frame, text="Communication", padding="5")
-        comm_frame.grid(row=5, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
-        comm_frame.columnconfigure(0, weight=1)
-        comm_frame.rowconfigure(0, weight=1)
-        
         # Populate countries
         self.populate_countries()
         
-        # Log area
-        self.log_text = scrolledtext.ScrolledText(comm_frame, height=12, width=70)
-        self.log_text.grid(row=0, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
+        # Communication area with the log on top of the message input
+        comm_frame, self.log_text = build_log_frame(main_frame, "Communication", row=5, height=12)
+        self.root.after(self.LOG_FLUSH_MS, self._flush_log)
+        self.root.after(self.UI_POLL_MS, self._drain_ui_queue)
         
         # Message input
         msg_frame = ttk.Frame(comm_frame)
         msg_frame.grid(row=1, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(5, 0))
         msg_frame.columnconfigure(0, weight=1)
         
-        self.message_var = tk.StringVar()
-        message_entry = ttk.Entry(msg_frame, textvariable=self.message_var)
-        message_entry.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 10))
-        message_entry.bind("<Return>", lambda e: self.send_message())
+        self.message_entry = ttk.Entry(msg_frame)
+        self.message_entry.grid(row=0, column=0, sticky=(tk.W, tk.E), padx=(0, 10))
+        self.message_entry.bind("<Return>", lambda e: self.send_message())
         
         send_button = ttk.Button(msg_frame, text="Send", command=self.send_message)
         send_button.grid(row=0, column=1)
     
     def populate_countries(self):
         """Populate country dropdown with available countries"""
-        countries = self.location_manager.get_countries()
-        country_display = []
-        for country in countries:
-            flag = self.location_manager.get_country_flag(country)
-            country_display.append(f"{flag} {country}")
-        
-        self.country_combo['values'] = country_display
+        self.country_combo['values'] = self.location_manager.get_country_labels()
+        self._country_by_index = self.location_manager.get_countries()
         
         # Auto-select best country
         best_country, best_server = self.location_manager.get_best_server()
@@ -444,50 +497,59 @@ class VPNClientGUI:
     def populate_servers(self, country: str):
         """Populate server dropdown for selected country"""
         servers = self.location_manager.get_servers_by_country(country)
-        server_display = []
-        
-        for server in servers:
-            load_color = "🟢" if server["load"] < 30 else "🟡" if server["load"] < 70 else "🔴"
-            ping = self.location_manager.simulate_ping(server["ip"])
-            server_display.append(f"{server['name']} - {server['city']} {load_color} ({server['load']}% load, {ping}ms)")
+        labels = self.location_manager.get_server_labels(country)
         
-        self.server_combo['values'] = server_display
+        if labels != self._shown_server_labels:
+            self.server_combo['values'] = labels
+            self._shown_server_labels = labels
+        self._server_by_index = servers
         
         # Auto-select best server in country
         if servers:
-            best_server = min(servers, key=lambda x: x["load"])
-            load_color = "🟢" if best_server["load"] < 30 else "🟡" if best_server["load"] < 70 else "🔴"
-            ping = self.location_manager.simulate_ping(best_server["ip"])
-            self.server_combo.set(f"{best_server['name']} - {best_server['city']} {load_color} ({best_server['load']}% load, {ping}ms)")
+            best_index = min(range(len(servers)), key=lambda i: servers[i].load)
+            best_server = servers[best_index]
+            self.server_combo.set(labels[best_index])
             self.selected_server = best_server
             self.update_server_info(best_server)
     
-    def on_country_changed(self, event):
-        """Handle country selection change"""
-        selected = self.country_var.get()
-        if selected:
-            # Extract country name (remove flag emoji)
-            country = selected.split(' ', 1)[1] if ' ' in selected else selected
+    def on_country_changed(self, event: tk.Event):
+        """Handle country selection change once the selection settles"""
+        if self._country_debounce_id:
+            self.root.after_cancel(self._country_debounce_id)
+        self._country_debounce_id = self.root.after(self.SELECTION_DEBOUNCE_MS,
+                                                    self._do_country_change)
+    
+    def _do_country_change(self):
+        """Show the servers of the selected country"""
+        self._country_debounce_id = None
+        index = self.country_combo.current()
+        if index >= 0:
+            country = self._country_by_index[index]
             self.selected_country = country
             self.populate_servers(country)
     
-    def on_server_changed(self, event):
-        """Handle server selection change"""
-        selected = self.server_var.get()
-        if selected and self.selected_country:
-            # Extract server name
-            server_name = selected.split(' - ')[0]
-            server_info = self.location_manager.get_server_info(self.selected_country, server_name)
-            if server_info:
-                self.selected_server = server_info
-                self.update_server_info(server_info)
-    
-    def update_server_info(self, server: dict):
+    def on_server_changed(self, event: tk.Event):
+        """Handle server selection change once the selection settles"""
+        if self._server_debounce_id:
+            self.root.after_cancel(self._server_debounce_id)
+        self._server_debounce_id = self.root.after(self.SELECTION_DEBOUNCE_MS,
+                                                   self._do_server_change)
+    
+    def _do_server_change(self):
+        """Show details of the selected server"""
+        self._server_debounce_id = None
+        index = self.server_combo.current()
+        if index >= 0:
+            server_info = self._server_by_index[index]
+            self.selected_server = server_info
+            self.update_server_info(server_info)
+    
+    def update_server_info(self, server: Server):
         """Update server information display"""
         if server:
-            ping = self.location_manager.simulate_ping(server["ip"])
-            load_status = "Excellent" if server["load"] < 30 else "Good" if server["load"] < 70 else "Busy"
-            info_text = f"📍 {server['city']} | 📊 Load: {server['load']}% ({load_status}) | 🏓 Ping: ~{ping}ms | 🌐 IP: {server['ip']}"
+            ping = self.location_manager.get_ping(server.ip)
+            load_status = self.location_manager.load_status(server.load)
+            info_text = f"📍 {server.city} | 📊 Load: {server.load}% ({load_status}) | 🏓 Ping: ~{ping}ms | 🌐 IP: {server.ip}"
             self.server_info_var.set(info_text)
         else:
             self.server_info_var.set("Select a server to see details")
@@ -503,13 +565,12 @@ class VPNClientGUI:
             
             # Update server selection
             self.populate_servers(best_country)
-            load_color = "🟢" if best_server["load"] < 30 else "🟡" if best_server["load"] < 70 else "🔴"
-            ping = self.location_manager.simulate_ping(best_server["ip"])
-            self.server_combo.set(f"{best_server['name']} - {best_server['city']} {load_color} ({best_server['load']}% load, {ping}ms)")
+            self.server_combo.set(self.location_manager.format_server_label(
+                best_server, self.location_manager.get_ping(best_server.ip)))
             self.selected_server = best_server
             self.update_server_info(best_server)
             
-            self.log_message(f"🚀 Auto-selected best server: {best_server['name']} in {best_country}")
+            self.log_message(f"🚀 Auto-selected best server: {best_server.name} in {best_country}")
     
     def refresh_servers(self):
         """Refresh server list and loads"""
@@ -519,16 +580,42 @@ class VPNClientGUI:
         self.log_message("🔄 Server list refreshed")
     
     def log_message(self, message: str, color: str = "black"):
-        """Add message to log"""
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.log_text.see(tk.END)
+        """Queue a message for the log; safe to call from any thread"""
+        self._log_queue.append(f"[{_ts()}] {message}\n")
+    
+    def _flush_log(self):
+        """Write all queued log lines with a single insert, then reschedule"""
+        if self._log_queue:
+            lines = [self._log_queue.popleft() for _ in range(len(self._log_queue))]
+            # Only follow new lines if the user hasn't scrolled up to read older ones
+            follow = self.log_text.yview()[1] >= 1.0
+            self.log_text.configure(state=tk.NORMAL)
+            self.log_text.insert(tk.END, "".join(lines))
+            # Keep only the newest lines so memory and redraw cost stay bounded
+            line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1  # text ends in \n
+            excess = line_count - self.LOG_MAX_LINES
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.configure(state=tk.DISABLED)
+            if follow:
+                self.log_text.see(tk.END)
+        self.root.after(self.LOG_FLUSH_MS, self._flush_log)
+    
+    def _apply_pending_selection(self):
+        """Run selection handlers still waiting out their debounce delay"""
+        if self._country_debounce_id:
+            self.root.after_cancel(self._country_debounce_id)
+            self._do_country_change()
+        if self._server_debounce_id:
+            self.root.after_cancel(self._server_debounce_id)
+            self._do_server_change()
     
     def connect_vpn(self):
         """Connect to VPN server"""
+        self._apply_pending_selection()
         try:
-            username = self.username_var.get().strip()
-            password = self.password_var.get().strip()
+            username = self.username_entry.get().strip()
+            password = self.password_entry.get().strip()
             
             if not all([username, password]):
                 messagebox.showerror("Error", "Username and password are required")
@@ -539,7 +626,7 @@ class VPNClientGUI:
                 return
             
             # Use selected server details
-            host = self.selected_server["ip"]
+            host = self.selected_server.ip
             port = 8080  # Default VPN port
             
             # For demo purposes, we'll use localhost since these are simulated IPs
@@ -554,36 +641,87 @@ class VPNClientGUI:
             self.status_var.set("🟡 Connecting...")
             
             flag = self.location_manager.get_country_flag(self.selected_country)
-            self.connection_info_var.set(f"Connecting to {self.selected_server['name']} in {flag} {self.selected_country}...")
+            self.connection_info_var.set(f"Connecting to {self.selected_server.name} in {flag} {self.selected_country}...")
             
-            # Connect in separate thread
-            connect_thread = threading.Thread(target=self._connect_thread, daemon=True)
-            connect_thread.start()
+            # Connect and receive on the event loop
+            asyncio.run_coroutine_threadsafe(self._run_client(), self._loop)
             
         except ValueError:
             messagebox.showerror("Error", "Invalid port number")
         except Exception as e:
             messagebox.showerror("Error", f"Connection error: {e}")
     
-    def _connect_thread(self):
-        """Connect to server in separate thread"""
+    def _run_loop(self):
+        """Run the I/O loop until on_closing stops it, then release its selector"""
         try:
-            if self.client.connect():
-                self.connected = True
-                self.root.after(0, self._on_connected)
-                
-                # Listen for messages
-                while self.connected and self.client.connected:
-                    try:
-                        data = self.client.receive_data()
-                        if data:
-                            self.root.after(0, lambda: self.log_message(f"Received: {data.decode()}"))
-                    except:
-                        break
-            else:
-                self.root.after(0, lambda: messagebox.showerror("Error", "Failed to connect"))
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+    
+    def _post(self, callback, *args):
+        """Run callback on the Tk thread; safe to call from any thread"""
+        self._ui_queue.put((callback, args))
+    
+    def _drain_ui_queue(self):
+        """Run the callbacks posted by the event loop and executor threads"""
+        try:
+            while True:
+                callback, args = self._ui_queue.get_nowait()
+                callback(*args)
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.UI_POLL_MS, self._drain_ui_queue)
+    
+    async def _run_client(self):
+        """Connect, then have the loop call back whenever the socket is readable"""
+        client = self.client
+        try:
+            # Blocking connect, key derivation and auth run off the loop thread
+            if not await self._loop.run_in_executor(None, client.connect):
+                self._post(messagebox.showerror, "Error", "Failed to connect")
+                return
+        except Exception as e:
+            self._post(messagebox.showerror, "Error", f"Connection error: {e}")
+            return
+        
+        self.connected = True
+        self._post(self._on_connected)
+        
+        self._show_received(client.feed(b''))  # anything that arrived with the auth reply
+        self._loop.add_reader(client.socket, self._on_readable, client)
+    
+    def _on_readable(self, client: VPNClient):
+        """Read what has arrived and pass complete messages to the log"""
+        error = None
+        try:
+            data = client.read_chunk()
+            if data:
+                self._show_received(client.feed(data))
+                return
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Error", f"Connection error: {e}"))
+            error = e
+        
+        # Peer closed the connection or it failed: stop watching the socket
+        self._loop.remove_reader(client.socket)
+        if self.connected:
+            if error:
+                self._post(messagebox.showerror, "Error", f"Connection error: {error}")
+            else:
+                self.log_message("Connection closed by server")
+            self._post(self.disconnect_vpn)
+    
+    def _show_received(self, messages: List[bytes]):
+        """Log messages received from the server"""
+        for message in messages:
+            if message:
+                self.log_message(f"Received: {message.decode()}")
+    
+    async def _disconnect(self, client: VPNClient):
+        """Stop watching the socket, then close the connection"""
+        if client.socket:
+            self._loop.remove_reader(client.socket)
+        client.disconnect()
     
     def _on_connected(self):
         """Update UI when connected"""
@@ -593,9 +731,9 @@ class VPNClientGUI:
         
         if self.selected_server and self.selected_country:
             flag = self.location_manager.get_country_flag(self.selected_country)
-            ping = self.location_manager.simulate_ping(self.selected_server["ip"])
-            self.connection_info_var.set(f"Connected to {self.selected_server['name']} in {flag} {self.selected_country} | {ping}ms ping")
-            self.log_message(f"🟢 Connected to VPN server: {self.selected_server['name']} in {self.selected_country}")
+            ping = self.location_manager.get_ping(self.selected_server.ip)
+            self.connection_info_var.set(f"Connected to {self.selected_server.name} in {flag} {self.selected_country} | {ping}ms ping")
+            self.log_message(f"🟢 Connected to VPN server: {self.selected_server.name} in {self.selected_country}")
         else:
             self.log_message("🟢 Connected to VPN server!")
     
@@ -603,7 +741,8 @@ class VPNClientGUI:
         """Disconnect from VPN server"""
         self.connected = False
         if self.client:
-            self.client.disconnect()
+            self._pending_disconnect = asyncio.run_coroutine_threadsafe(
+                self._disconnect(self.client), self._loop)
             self.client = None
         
         self.connect_button.config(state=tk.NORMAL)
@@ -618,16 +757,29 @@ class VPNClientGUI:
             messagebox.showwarning("Warning", "Not connected to VPN")
             return
         
-        message = self.message_var.get().strip()
+        message = self.message_entry.get().strip()
         if not message:
             return
         
-        try:
-            self.client.send_data(message.encode())
+        # Send on the event loop so a full socket buffer never stalls the UI
+        self.message_entry.delete(0, tk.END)
+        future = asyncio.run_coroutine_threadsafe(
+            self._send(self.client, message.encode()), self._loop)
+        future.add_done_callback(
+            lambda f: self._post(self._on_sent, message,
+                                 None if f.cancelled() else f.exception()))
+    
+    async def _send(self, client: VPNClient, data: bytes):
+        """Queue data for sending without blocking the receive loop"""
+        # send_data may flush synchronously; keep reading replies meanwhile
+        await self._loop.run_in_executor(None, client.send_data, data)
+    
+    def _on_sent(self, message: str, error: Optional[BaseException]):
+        """Report the outcome of send_message"""
+        if error:
+            messagebox.showerror("Error", f"Failed to send message: {error}")
+        else:
             self.log_message(f"Sent: {message}")
-            self.message_var.set("")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to send message: {e}")
     
     def run(self):
         """Run the GUI"""
@@ -638,31 +790,38 @@ class VPNClientGUI:
         """Handle window closing"""
         if self.connected:
             self.disconnect_vpn()
+        if self._pending_disconnect:
+            try:
+                self._pending_disconnect.result(timeout=2)  # let the goodbye go out
+            except Exception:
+                pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
         self.root.destroy()
 
 
 def main():
     """Main function to choose between server and client"""
     root = tk.Tk()
-    root.withdraw()  # Hide main window
-    
-    choice = messagebox.askyesnocancel(
-        "Fosen VPN",
-        "Choose application type:\n\nYes = VPN Server\nNo = VPN Client\nCancel = Exit"
-    )
-    
-    root.destroy()
-    
-    if choice is True:
-        # Run VPN Server
-        app = VPNServerGUI()
-        app.run()
-    elif choice is False:
-        # Run VPN Client
-        app = VPNClientGUI()
-        app.run()
-    # If cancelled, just exit
+    root.title("Fosen VPN")
+    
+    def launch(gui_class):
+        # Build the chosen GUI on the same root instead of starting a second Tk
+        for widget in root.winfo_children():
+            widget.destroy()
+        app = gui_class(root)
+        root.protocol("WM_DELETE_WINDOW", app.on_closing)
+    
+    chooser = ttk.Frame(root, padding="20")
+    chooser.pack(fill=tk.BOTH, expand=True)
+    ttk.Label(chooser, text="Choose application type:",
+              font=("Arial", 12, "bold")).pack(pady=(0, 15))
+    for text, command in (("VPN Server", lambda: launch(VPNServerGUI)),
+                          ("VPN Client", lambda: launch(VPNClientGUI)),
+                          ("Exit", root.destroy)):
+        ttk.Button(chooser, text=text, width=20, command=command).pack(pady=5, ipady=5)
+    
+    root.mainloop()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
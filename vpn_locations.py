@@ -1,178 +1,318 @@
-import json
 import random
-from typing import Dict, List, Tuple
+import bisect
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Load bands (%): below 30 is excellent, below 70 good, otherwise busy
+_LOAD_BOUNDS = (30, 70)
+_LOAD_COLORS = ("🟢", "🟡", "🔴")
+_LOAD_STATUSES = ("Excellent", "Good", "Busy")
+_LOAD_STEPS = range(-5, 6)  # per-update load change, as randint(-5, 5)
+
+# Simulated base ping (ms) by IP prefix, i.e. by server "location"
+_BASE_PING = {
+    "198.51.100": 25,  # US servers
+    "203.0.113.2": 85,  # UK servers  
+    "203.0.113.3": 95,  # German servers
+    "203.0.113.4": 180, # Japan servers
+    "203.0.113.5": 45,  # Canada servers
+    "203.0.113.6": 105, # France servers
+    "203.0.113.7": 90,  # Netherlands servers
+    "203.0.113.8": 220, # Singapore servers
+    "203.0.113.9": 195, # Australia servers
+    "203.0.113.10": 110 # Switzerland servers
+}
+
+
+def _prefix_base_ping(server_ip: str) -> Optional[int]:
+    """Get the base ping of the first matching prefix, or None"""
+    for prefix, ping in _BASE_PING.items():
+        if server_ip.startswith(prefix):
+            return ping
+    return None
+
+
+@dataclass
+class Server:
+    """One VPN server; slotted, since every label and stats pass reads its fields"""
+    __slots__ = ("name", "city", "ip", "load")
+    name: str
+    city: str
+    ip: str
+    load: int
+
+
+@dataclass
+class Country:
+    """A country's servers and flag emoji"""
+    __slots__ = ("servers", "flag")
+    servers: List[Server]
+    flag: str
+
 
 class VPNServerLocation:
     """Manages VPN server locations and countries"""
     
     def __init__(self):
         self.locations = {
-            "United States": {
-                "servers": [
-                    {"name": "US-East-1", "city": "New York", "ip": "198.51.100.10", "load": 45},
-                    {"name": "US-East-2", "city": "Miami", "ip": "198.51.100.11", "load": 32},
-                    {"name": "US-West-1", "city": "Los Angeles", "ip": "198.51.100.12", "load": 67},
-                    {"name": "US-West-2", "city": "San Francisco", "ip": "198.51.100.13", "load": 28},
-                    {"name": "US-Central", "city": "Chicago", "ip": "198.51.100.14", "load": 52}
+            "United States": Country(
+                servers=[
+                    Server("US-East-1", "New York", "198.51.100.10", 45),
+                    Server("US-East-2", "Miami", "198.51.100.11", 32),
+                    Server("US-West-1", "Los Angeles", "198.51.100.12", 67),
+                    Server("US-West-2", "San Francisco", "198.51.100.13", 28),
+                    Server("US-Central", "Chicago", "198.51.100.14", 52)
                 ],
-                "flag": "🇺🇸"
-            },
-            "United Kingdom": {
-                "servers": [
-                    {"name": "UK-London-1", "city": "London", "ip": "203.0.113.20", "load": 41},
-                    {"name": "UK-London-2", "city": "London", "ip": "203.0.113.21", "load": 35},
-                    {"name": "UK-Manchester", "city": "Manchester", "ip": "203.0.113.22", "load": 28}
+                flag="🇺🇸"
+            ),
+            "United Kingdom": Country(
+                servers=[
+                    Server("UK-London-1", "London", "203.0.113.20", 41),
+                    Server("UK-London-2", "London", "203.0.113.21", 35),
+                    Server("UK-Manchester", "Manchester", "203.0.113.22", 28)
                 ],
-                "flag": "🇬🇧"
-            },
-            "Germany": {
-                "servers": [
-                    {"name": "DE-Frankfurt-1", "city": "Frankfurt", "ip": "203.0.113.30", "load": 38},
-                    {"name": "DE-Frankfurt-2", "city": "Frankfurt", "ip": "203.0.113.31", "load": 45},
-                    {"name": "DE-Berlin", "city": "Berlin", "ip": "203.0.113.32", "load": 33}
+                flag="🇬🇧"
+            ),
+            "Germany": Country(
+                servers=[
+                    Server("DE-Frankfurt-1", "Frankfurt", "203.0.113.30", 38),
+                    Server("DE-Frankfurt-2", "Frankfurt", "203.0.113.31", 45),
+                    Server("DE-Berlin", "Berlin", "203.0.113.32", 33)
                 ],
-                "flag": "🇩🇪"
-            },
-            "Japan": {
-                "servers": [
-                    {"name": "JP-Tokyo-1", "city": "Tokyo", "ip": "203.0.113.40", "load": 55},
-                    {"name": "JP-Tokyo-2", "city": "Tokyo", "ip": "203.0.113.41", "load": 62},
-                    {"name": "JP-Osaka", "city": "Osaka", "ip": "203.0.113.42", "load": 43}
+                flag="🇩🇪"
+            ),
+            "Japan": Country(
+                servers=[
+                    Server("JP-Tokyo-1", "Tokyo", "203.0.113.40", 55),
+                    Server("JP-Tokyo-2", "Tokyo", "203.0.113.41", 62),
+                    Server("JP-Osaka", "Osaka", "203.0.113.42", 43)
                 ],
-                "flag": "🇯🇵"
-            },
-            "Canada": {
-                "servers": [
-                    {"name": "CA-Toronto", "city": "Toronto", "ip": "203.0.113.50", "load": 29},
-                    {"name": "CA-Vancouver", "city": "Vancouver", "ip": "203.0.113.51", "load": 36}
+                flag="🇯🇵"
+            ),
+            "Canada": Country(
+                servers=[
+                    Server("CA-Toronto", "Toronto", "203.0.113.50", 29),
+                    Server("CA-Vancouver", "Vancouver", "203.0.113.51", 36)
                 ],
-                "flag": "🇨🇦"
-            },
-            "France": {
-                "servers": [
-                    {"name": "FR-Paris-1", "city": "Paris", "ip": "203.0.113.60", "load": 44},
-                    {"name": "FR-Paris-2", "city": "Paris", "ip": "203.0.113.61", "load": 51}
+                flag="🇨🇦"
+            ),
+            "France": Country(
+                servers=[
+                    Server("FR-Paris-1", "Paris", "203.0.113.60", 44),
+                    Server("FR-Paris-2", "Paris", "203.0.113.61", 51)
                 ],
-                "flag": "🇫🇷"
-            },
-            "Netherlands": {
-                "servers": [
-                    {"name": "NL-Amsterdam-1", "city": "Amsterdam", "ip": "203.0.113.70", "load": 39},
-                    {"name": "NL-Amsterdam-2", "city": "Amsterdam", "ip": "203.0.113.71", "load": 47}
+                flag="🇫🇷"
+            ),
+            "Netherlands": Country(
+                servers=[
+                    Server("NL-Amsterdam-1", "Amsterdam", "203.0.113.70", 39),
+                    Server("NL-Amsterdam-2", "Amsterdam", "203.0.113.71", 47)
                 ],
-                "flag": "🇳🇱"
-            },
-            "Singapore": {
-                "servers": [
-                    {"name": "SG-Singapore-1", "city": "Singapore", "ip": "203.0.113.80", "load": 58},
-                    {"name": "SG-Singapore-2", "city": "Singapore", "ip": "203.0.113.81", "load": 41}
+                flag="🇳🇱"
+            ),
+            "Singapore": Country(
+                servers=[
+                    Server("SG-Singapore-1", "Singapore", "203.0.113.80", 58),
+                    Server("SG-Singapore-2", "Singapore", "203.0.113.81", 41)
                 ],
-                "flag": "🇸🇬"
-            },
-            "Australia": {
-                "servers": [
-                    {"name": "AU-Sydney", "city": "Sydney", "ip": "203.0.113.90", "load": 34},
-                    {"name": "AU-Melbourne", "city": "Melbourne", "ip": "203.0.113.91", "load": 42}
+                flag="🇸🇬"
+            ),
+            "Australia": Country(
+                servers=[
+                    Server("AU-Sydney", "Sydney", "203.0.113.90", 34),
+                    Server("AU-Melbourne", "Melbourne", "203.0.113.91", 42)
                 ],
-                "flag": "🇦🇺"
-            },
-            "Switzerland": {
-                "servers": [
-                    {"name": "CH-Zurich", "city": "Zurich", "ip": "203.0.113.100", "load": 25}
+                flag="🇦🇺"
+            ),
+            "Switzerland": Country(
+                servers=[
+                    Server("CH-Zurich", "Zurich", "203.0.113.100", 25)
                 ],
-                "flag": "🇨🇭"
-            }
+                flag="🇨🇭"
+            )
+        }
+        
+        # Flat, parallel views of every server for whole-catalog queries
+        self._servers_flat: List[Server] = [server for data in self.locations.values()
+                                          for server in data.servers]
+        self._country_ref: List[str] = [country for country, data in self.locations.items()
+                                        for _ in data.servers]
+        self._loads = array('b', (server.load for server in self._servers_flat))
+        self._best_index: Optional[int] = None  # lowest load overall, set by _update_server_loads
+        # Per-country load total and lowest-load server, kept current by _update_server_loads
+        self._country_meta: Dict[str, Dict] = {
+            country: {"sum": sum(server.load for server in data.servers),
+                      "count": len(data.servers), "best": None}
+            for country, data in self.locations.items()
         }
         
+        # Base ping of every catalog IP, resolved from _BASE_PING once
+        self._base_ping: Dict[str, int] = {}
+        for server in self._servers_flat:
+            base = _prefix_base_ping(server.ip)
+            if base is not None:
+                self._base_ping[server.ip] = base
+        
+        self._countries: Tuple[str, ...] = tuple(self.locations)  # the catalog never changes
+        
+        # Values derived from the current loads, built on demand
+        self._location_stats: Optional[Dict] = None
+        self._formatted_stats: Optional[List[Tuple[str, str, str, str]]] = None
+        self._ping_cache: Dict[str, int] = {}
+        self._label_cache: Dict[str, List[str]] = {}
+        
         # Simulate server loads changing over time
         self._update_server_loads()
     
     def _update_server_loads(self):
         """Simulate dynamic server load changes"""
-        for country in self.locations.values():
-            for server in country["servers"]:
-                # Add some randomness to server loads
-                server["load"] += random.randint(-5, 5)
-                server["load"] = max(10, min(90, server["load"]))  # Keep between 10-90%
+        loads = self._loads
+        country_meta = self._country_meta
+        for meta in country_meta.values():
+            meta["best"] = None
+        # One choices() call draws every server's step; randint per server costs ~3x more
+        steps = random.choices(_LOAD_STEPS, k=len(loads))
+        best_index, best_load = None, 0
+        for i, server in enumerate(self._servers_flat):
+            # Add some randomness to server loads, keeping them between 10-90%
+            load = max(10, min(90, loads[i] + steps[i]))
+            meta = country_meta[self._country_ref[i]]
+            meta["sum"] += load - loads[i]
+            if meta["best"] is None or load < meta["best"].load:
+                meta["best"] = server  # first of equal loads, as min() picks
+            if best_index is None or load < best_load:
+                best_index, best_load = i, load
+            loads[i] = server.load = load
+        self._best_index = best_index
+        self._location_stats = None
+        self._formatted_stats = None
+        # Pings are re-measured with every load update, and the labels show both
+        self._label_cache.clear()
+        self._ping_cache.clear()
+        self.warm_ping_cache()
     
-    def get_countries(self) -> List[str]:
+    def get_countries(self) -> Tuple[str, ...]:
         """Get list of available countries"""
-        return list(self.locations.keys())
+        return self._countries
     
-    def get_servers_by_country(self, country: str) -> List[Dict]:
+    def get_servers_by_country(self, country: str) -> List[Server]:
         """Get servers for a specific country"""
         if country in self.locations:
-            return self.locations[country]["servers"]
+            return self.locations[country].servers
         return []
     
-    def get_best_server(self, country: str = None) -> Tuple[str, Dict]:
+    def get_best_server(self, country: str = None) -> Tuple[Optional[str], Optional[Server]]:
         """Get the best server (lowest load) for a country or globally"""
         if country and country in self.locations:
-            servers = self.locations[country]["servers"]
-            best_server = min(servers, key=lambda x: x["load"])
-            return country, best_server
+            return country, self._country_meta[country]["best"]
         else:
-            # Find globally best server
-            best_country = None
-            best_server = None
-            min_load = 100
-            
-            for country_name, country_data in self.locations.items():
-                for server in country_data["servers"]:
-                    if server["load"] < min_load:
-                        min_load = server["load"]
-                        best_server = server
-                        best_country = country_name
-            
-            return best_country, best_server
+            # Globally best server, picked while the loads were last updated
+            i = self._best_index
+            if i is None:
+                return None, None
+            return self._country_ref[i], self._servers_flat[i]
+    
+    def get_country_labels(self) -> List[str]:
+        """Get "<flag> <country>" labels for all countries"""
+        return [f"{data.flag} {country}" for country, data in self.locations.items()]
     
     def get_country_flag(self, country: str) -> str:
         """Get flag emoji for country"""
         if country in self.locations:
-            return self.locations[country]["flag"]
+            return self.locations[country].flag
         return "🌍"
     
-    def get_server_info(self, country: str, server_name: str) -> Dict:
+    def get_server_info(self, country: str, server_name: str) -> Optional[Server]:
         """Get detailed info for a specific server"""
         if country in self.locations:
-            servers = self.locations[country]["servers"]
+            servers = self.locations[country].servers
             for server in servers:
-                if server["name"] == server_name:
+                if server.name == server_name:
                     return server
-        return {}
+        return None
+    
+    @staticmethod
+    def load_indicator(load: float) -> str:
+        """Get traffic-light emoji for a load percentage"""
+        return _LOAD_COLORS[bisect.bisect_right(_LOAD_BOUNDS, load)]
+    
+    @staticmethod
+    def load_status(load: float) -> str:
+        """Get a one-word rating for a load percentage"""
+        return _LOAD_STATUSES[bisect.bisect_right(_LOAD_BOUNDS, load)]
+    
+    @staticmethod
+    def format_server_label(server: Server, ping: int) -> str:
+        """Get the server dropdown label for a server"""
+        return (f"{server.name} - {server.city} {VPNServerLocation.load_indicator(server.load)} "
+                f"({server.load}% load, {ping}ms)")
     
     def simulate_ping(self, server_ip: str) -> int:
         """Simulate ping time to server (in ms)"""
-        # Simulate different ping times based on "location"
-        base_ping = {
-            "198.51.100": 25,  # US servers
-            "203.0.113.2": 85,  # UK servers  
-            "203.0.113.3": 95,  # German servers
-            "203.0.113.4": 180, # Japan servers
-            "203.0.113.5": 45,  # Canada servers
-            "203.0.113.6": 105, # France servers
-            "203.0.113.7": 90,  # Netherlands servers
-            "203.0.113.8": 220, # Singapore servers
-            "203.0.113.9": 195, # Australia servers
-            "203.0.113.10": 110 # Switzerland servers
-        }
-        
-        # Get base ping from IP prefix
-        for prefix, ping in base_ping.items():
-            if server_ip.startswith(prefix):
-                return ping + random.randint(-10, 20)
+        # Catalog servers hit the per-IP table; anything else falls back to the prefixes
+        base = self._base_ping.get(server_ip)
+        if base is None:
+            base = _prefix_base_ping(server_ip)
+        if base is not None:
+            return base + random.randint(-10, 20)
         
         return random.randint(50, 200)
     
+    def get_ping(self, server_ip: str) -> int:
+        """Get the simulated ping for a server, measured once per load update"""
+        ping = self._ping_cache.get(server_ip)
+        if ping is None:
+            ping = self._ping_cache[server_ip] = self.simulate_ping(server_ip)
+        return ping
+    
+    def warm_ping_cache(self):
+        """Measure every server's ping up front"""
+        for country in self.locations.values():
+            for server in country.servers:
+                self.get_ping(server.ip)
+    
+    def get_server_labels(self, country: str) -> List[str]:
+        """Get dropdown labels for a country's servers, formatted once per load update"""
+        labels = self._label_cache.get(country)
+        if labels is None:
+            labels = [self.format_server_label(server, self.get_ping(server.ip))
+                      for server in self.get_servers_by_country(country)]
+            self._label_cache[country] = labels
+        return labels
+    
     def get_location_stats(self) -> Dict:
-        """Get statistics for all locations"""
-        stats = {}
-        for country, data in self.locations.items():
-            total_servers = len(data["servers"])
-            avg_load = sum(s["load"] for s in data["servers"]) / total_servers
-            stats[country] = {
-                "servers": total_servers,
-                "avg_load": round(avg_load, 1),
-                "flag": data["flag"]
-            }
-        return stats
\ No newline at end of file
+        """Get statistics for all locations, rebuilt only when loads change"""
+        if self._location_stats is None:
+            stats = {}
+            for country, meta in self._country_meta.items():
+                stats[country] = {
+                    "servers": meta["count"],
+                    "avg_load": round(meta["sum"] / meta["count"], 1),
+                    "flag": self.locations[country].flag
+                }
+            self._location_stats = stats
+        return self._location_stats
+    
+    def formatted_stats(self) -> List[Tuple[str, str, str, str]]:
+        """Get location stats as display rows, rebuilt only when loads change"""
+        if self._formatted_stats is None:
+            rows = []
+            for country, data in self.get_location_stats().items():
+                avg_load = data["avg_load"]
+                status = f"{self.load_indicator(avg_load)} {self.load_status(avg_load)}"
+                rows.append((f"{data['flag']} {country}", f"{data['servers']} servers",
+                             f"{avg_load}%", status))
+            self._formatted_stats = rows
+        return self._formatted_stats
+
+
+_location_manager: Optional[VPNServerLocation] = None
+
+
+def get_location_manager() -> VPNServerLocation:
+    """Get the location manager shared by every window in the process"""
+    global _location_manager
+    if _location_manager is None:
+        _location_manager = VPNServerLocation()  # its first load update warms the pings
+    return _location_manager
@@ -1,21 +1,17 @@
 import os
 import sys
+import asyncio
 import struct
 import socket
 import threading
 import time
-import json
-import base64
-import hashlib
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+import hmac
+import itertools
+import platform
+from typing import Dict, List, Optional, Tuple, Union
 
 try:
-    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-    from cryptography.hazmat.backends import default_backend
-    from cryptography.hazmat.primitives import hashes, serialization
-    from cryptography.hazmat.primitives.asymmetric import rsa, padding
-    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 except ImportError:
     print("Error: cryptography library not found. Install with: pip install cryptography")
     sys.exit(1)
@@ -31,12 +27,45 @@ except ImportError:
         BRIGHT = DIM = RESET_ALL = ""
 
 
+# Packet header: magic, version, message type, payload length
+_HDR_STRUCT = struct.Struct('!4sBBI')
+_HDR_SIZE = _HDR_STRUCT.size
+
+# Handshake request: client version, cipher id, username as a pascal string (up to 31 bytes)
+_HANDSHAKE_STRUCT = struct.Struct('!BB32p')
+# Handshake reply: server version, status, accepted cipher id, the user's 16-byte key salt
+_HANDSHAKE_REPLY_STRUCT = struct.Struct('!BBB16s')
+# Encrypted auth body: timestamp, username as a pascal string (up to 31 bytes)
+_AUTH_STRUCT = struct.Struct('!Q32p')
+
+
+def _has_aes_acceleration() -> bool:
+    """Best-effort check for hardware AES and carry-less multiply (GCM's fast path)"""
+    machine = platform.machine().lower()
+    if sys.platform == 'darwin' and machine in ('arm64', 'aarch64'):
+        return True  # Apple silicon always has the ARMv8 crypto extensions
+    
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpuinfo = f.read()
+    except OSError:
+        # No cpuinfo to inspect; every x86-64 CPU of the last decade has AES-NI
+        return machine in ('x86_64', 'amd64')
+    
+    flags = set()
+    for line in cpuinfo.splitlines():
+        key, _, value = line.partition(':')
+        if key.strip() in ('flags', 'Features'):
+            flags.update(value.split())
+    return 'aes' in flags and ('pclmulqdq' in flags or 'pmull' in flags)
+
+
 class VPNProtocol:
     """VPN Protocol constants and utilities"""
     
     # Protocol constants
     MAGIC_BYTES = b'\xDE\xAD\xBE\xEF'
-    VERSION = 1
+    VERSION = 4  # 3: struct handshake reply; 4: username in handshake, server-held salts
     
     # Message types
     MSG_HANDSHAKE = 0x01
@@ -47,282 +76,530 @@ class VPNProtocol:
     MSG_AUTH_SUCCESS = 0x06
     MSG_AUTH_FAILURE = 0x07
     
-    # Encryption settings
+    # AEAD ciphers; both use 256-bit keys, 96-bit nonces and 128-bit tags
+    CIPHER_AES_256_GCM = 0x01
+    CIPHER_CHACHA20_POLY1305 = 0x02
+    CIPHERS = {
+        CIPHER_AES_256_GCM: AESGCM,
+        CIPHER_CHACHA20_POLY1305: ChaCha20Poly1305,
+    }
+    
+    # Encryption settings (the AES_* sizes apply to ChaCha20-Poly1305 as well)
     AES_KEY_SIZE = 32  # 256-bit
-    AES_IV_SIZE = 16   # 128-bit
+    AES_IV_SIZE = 12   # 96-bit, the GCM standard nonce size
+    AES_TAG_SIZE = 16  # 128-bit
+    NONCE_PREFIX_SIZE = 8  # random per key holder; the rest of the IV is a counter
+    KDF_ITERATIONS = 100000
+    SALT_SIZE = 16
+    MAX_USERNAME_LENGTH = 31  # bytes, UTF-8 encoded
+    HANDSHAKE_OK = 0
+    HANDSHAKE_REJECTED = 1  # unsupported version or cipher; the server then hangs up
+    # Below this size a fresh ciphertext + concat is cheaper than filling a buffer
+    ENCRYPT_INTO_THRESHOLD = 1024
+    
+    # Payloads at least this large are sent without copying them behind the header
+    SEND_COPY_THRESHOLD = 16 * 1024
+    
+    # Frames announcing a bigger payload are rejected before any of it is read
+    MAX_PAYLOAD = 16 * 1024 * 1024
+    # Largest single send_data() message; leaves room for batching and the echo
+    MAX_MESSAGE_SIZE = 4 * 1024 * 1024
+    # Payloads at least this large are en/decrypted off the server's event loop
+    EXECUTOR_THRESHOLD = 64 * 1024
+    
+    @staticmethod
+    def create_header(msg_type: int, length: int) -> bytes:
+        """Create the header for a packet carrying `length` payload bytes"""
+        return _HDR_STRUCT.pack(VPNProtocol.MAGIC_BYTES, VPNProtocol.VERSION,
+                                msg_type, length)
     
     @staticmethod
     def create_packet(msg_type: int, data: bytes = b'') -> bytes:
         """Create a VPN protocol packet"""
-        header = struct.pack('!4sBBI', VPNProtocol.MAGIC_BYTES, 
-                           VPNProtocol.VERSION, msg_type, len(data))
-        return header + data
+        return VPNProtocol.create_header(msg_type, len(data)) + data
     
     @staticmethod
-    def parse_packet(data: bytes) -> Tuple[int, bytes]:
-        """Parse a VPN protocol packet"""
-        if len(data) < 10:
-            raise ValueError("Packet too short")
+    def _unpack_header(data: bytes) -> Tuple[int, int]:
+        """Validate the header at the start of `data`; return (msg_type, payload length)"""
+        magic, version, msg_type, length = _HDR_STRUCT.unpack_from(data, 0)
         
-        magic, version, msg_type, length = struct.unpack('!4sBBI', data[:10])
-        
-        if magic != VPNProtocol.MAGIC_BYTES:
+        if not hmac.compare_digest(magic, VPNProtocol.MAGIC_BYTES):
             raise ValueError("Invalid magic bytes")
         
         if version != VPNProtocol.VERSION:
             raise ValueError(f"Unsupported version: {version}")
         
-        if len(data) < 10 + length:
+        if length > VPNProtocol.MAX_PAYLOAD:
+            raise ValueError(f"Oversized packet: {length} bytes")
+        
+        return msg_type, length
+    
+    @staticmethod
+    def parse_packet(data: bytes) -> Tuple[int, bytes]:
+        """Parse a VPN protocol packet"""
+        if len(data) < _HDR_SIZE:
+            raise ValueError("Packet too short")
+        
+        msg_type, length = VPNProtocol._unpack_header(data)
+        
+        if len(data) < _HDR_SIZE + length:
             raise ValueError("Incomplete packet")
         
-        payload = data[10:10+length]
+        payload = data[_HDR_SIZE:_HDR_SIZE + length]
         return msg_type, payload
+    
+    @staticmethod
+    def pack_record(data: bytes) -> bytes:
+        """Length-prefix a message so several can share one MSG_DATA frame"""
+        return len(data).to_bytes(4, 'big') + data
+    
+    @staticmethod
+    def unpack_records(data: bytes) -> List[bytes]:
+        """Split a decrypted MSG_DATA body back into its messages"""
+        records = []
+        offset = 0
+        while offset < len(data):
+            if offset + 4 > len(data):
+                raise ValueError("Truncated record header")
+            length = int.from_bytes(data[offset:offset + 4], 'big')
+            offset += 4
+            if offset + length > len(data):
+                raise ValueError("Truncated record")
+            records.append(data[offset:offset + length])
+            offset += length
+        return records
+
+
+# Software AES-GCM is slower than ChaCha20-Poly1305 and not constant-time
+DEFAULT_CIPHER = (VPNProtocol.CIPHER_AES_256_GCM if _has_aes_acceleration()
+                  else VPNProtocol.CIPHER_CHACHA20_POLY1305)
+
+# Payload-free control packets never change, so they are built once
+_PKT_AUTH_SUCCESS = VPNProtocol.create_packet(VPNProtocol.MSG_AUTH_SUCCESS)
+_PKT_AUTH_FAILURE = VPNProtocol.create_packet(VPNProtocol.MSG_AUTH_FAILURE)
+_PKT_KEEPALIVE = VPNProtocol.create_packet(VPNProtocol.MSG_KEEPALIVE)
+_PKT_HANDSHAKE_REJECTED = VPNProtocol.create_packet(
+    VPNProtocol.MSG_HANDSHAKE,
+    _HANDSHAKE_REPLY_STRUCT.pack(VPNProtocol.VERSION, VPNProtocol.HANDSHAKE_REJECTED,
+                                 0, bytes(VPNProtocol.SALT_SIZE)))
+
+# Until the client authenticates it can only send these, so nothing bigger is buffered
+_PRE_AUTH_MAX_LENGTH = {
+    VPNProtocol.MSG_HANDSHAKE: _HANDSHAKE_STRUCT.size,
+    VPNProtocol.MSG_AUTH: _AUTH_STRUCT.size + VPNProtocol.AES_IV_SIZE + VPNProtocol.AES_TAG_SIZE,
+}
+
+
+class _EntropyPool:
+    """Hands out os.urandom bytes from a 4 KiB block, one syscall per block"""
+    
+    BLOCK_SIZE = 4096
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        """Drop buffered bytes; a forked child must never reuse its parent's"""
+        self._lock = threading.Lock()
+        self._buf = b''
+        self._pos = 0
+    
+    def draw(self, n: int) -> bytes:
+        with self._lock:
+            if len(self._buf) - self._pos < n:
+                self._buf = os.urandom(max(n, self.BLOCK_SIZE))
+                self._pos = 0
+            out = self._buf[self._pos:self._pos + n]
+            self._pos += n
+        return out
+
+
+_ENTROPY = _EntropyPool()
+if hasattr(os, 'register_at_fork'):  # POSIX only
+    os.register_at_fork(after_in_child=_ENTROPY.reset)
+
+# Keys the stable stand-in salts handed out for unknown usernames
+_DECOY_SALT_KEY = os.urandom(32)
+
+
+def _decoy_salt(username: bytes) -> bytes:
+    """Salt for a username with no account, so replies don't reveal which names exist"""
+    return hmac.digest(_DECOY_SALT_KEY, username, 'sha256')[:VPNProtocol.SALT_SIZE]
+
+
+def _pbkdf2(password: bytes, salt: bytes, iterations: int, length: int) -> bytes:
+    """Derive a key with PBKDF2; deliberately uncached so no password outlives the call"""
+    # Imported on first use; the server only runs the KDF when a user is added
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=length,
+        salt=salt,
+        iterations=iterations,
+    )
+    return kdf.derive(password)
 
 
 class VPNEncryption:
     """Handles encryption/decryption for VPN traffic"""
     
-    def __init__(self, password: str):
+    # One instance per session; slots keep it small and its hot attributes fast
+    __slots__ = ('password', 'salt', 'cipher', 'key', '_aead', '_encrypt_into',
+                 '_nonce_prefix', '_nonce_counter')
+    
+    def __init__(self, password: str, salt: Optional[bytes] = None,
+                 cipher: int = DEFAULT_CIPHER):
+        if cipher not in VPNProtocol.CIPHERS:
+            raise ValueError(f"Unsupported cipher: {cipher}")
+        
         self.password = password.encode()
-        self.salt = os.urandom(16)
-        self.key = self._derive_key()
+        self.salt = salt if salt is not None else _ENTROPY.draw(VPNProtocol.SALT_SIZE)
+        self._setup(self._derive_key(), cipher)
+    
+    @classmethod
+    def from_key(cls, key: bytes, salt: bytes, cipher: int = DEFAULT_CIPHER) -> 'VPNEncryption':
+        """Wrap an already derived key; PBKDF2 is skipped and no password is kept"""
+        if cipher not in VPNProtocol.CIPHERS:
+            raise ValueError(f"Unsupported cipher: {cipher}")
         
+        encryption = cls.__new__(cls)
+        encryption.password = None
+        encryption.salt = salt
+        encryption._setup(key, cipher)
+        return encryption
+    
+    def _setup(self, key: bytes, cipher: int):
+        """Create the AEAD context and nonce state for key"""
+        self.cipher = cipher
+        self.key = key
+        self._aead = VPNProtocol.CIPHERS[cipher](self.key)
+        # encrypt_into is only available in newer cryptography releases
+        self._encrypt_into = getattr(self._aead, 'encrypt_into', None)
+        # GCM nonces must be unique per key but need not be unpredictable
+        self._nonce_prefix = _ENTROPY.draw(VPNProtocol.NONCE_PREFIX_SIZE)
+        self._nonce_counter = itertools.count(1)
+    
     def _derive_key(self) -> bytes:
         """Derive encryption key from password"""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=VPNProtocol.AES_KEY_SIZE,
-            salt=self.salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        return kdf.derive(self.password)
-    
-    def encrypt(self, data: bytes) -> bytes:
-        """Encrypt data using AES-256-GCM"""
-        iv = os.urandom(VPNProtocol.AES_IV_SIZE)
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.GCM(iv),
-            backend=default_backend()
-        )
-        encryptor = cipher.encryptor()
-        ciphertext = encryptor.update(data) + encryptor.finalize()
-        return iv + encryptor.tag + ciphertext
+        return _pbkdf2(self.password, self.salt,
+                       VPNProtocol.KDF_ITERATIONS, VPNProtocol.AES_KEY_SIZE)
+    
+    def _next_nonce(self) -> bytes:
+        """Return the next prefix + counter nonce, refusing to wrap around"""
+        counter_size = VPNProtocol.AES_IV_SIZE - VPNProtocol.NONCE_PREFIX_SIZE
+        counter = next(self._nonce_counter)  # itertools.count is thread-safe
+        if counter >= 1 << (8 * counter_size):
+            raise RuntimeError("Nonce space exhausted; a new session key is required")
+        return self._nonce_prefix + counter.to_bytes(counter_size, 'big')
+    
+    def encrypt(self, data: bytes) -> Union[bytes, bytearray]:
+        """Encrypt data with the session AEAD (AES-256-GCM or ChaCha20-Poly1305)
+        
+        Payloads of ENCRYPT_INTO_THRESHOLD bytes or more come back as the
+        bytearray they were encrypted into; wrap them in bytes() before
+        hashing one or using it as a dict key.
+        """
+        iv = self._next_nonce()
+        if self._encrypt_into and len(data) >= VPNProtocol.ENCRYPT_INTO_THRESHOLD:
+            # Write iv + ciphertext + tag into one buffer instead of concatenating
+            out = bytearray(VPNProtocol.AES_IV_SIZE + len(data) + VPNProtocol.AES_TAG_SIZE)
+            out[:VPNProtocol.AES_IV_SIZE] = iv
+            self._encrypt_into(iv, data, None, memoryview(out)[VPNProtocol.AES_IV_SIZE:])
+            return out
+        # The AEAD appends the authentication tag to the ciphertext
+        return iv + self._aead.encrypt(iv, data, None)
     
     def decrypt(self, data: bytes) -> bytes:
-        """Decrypt data using AES-256-GCM"""
-        if len(data) < VPNProtocol.AES_IV_SIZE + 16:
+        """Decrypt data with the session AEAD"""
+        if len(data) < VPNProtocol.AES_IV_SIZE + VPNProtocol.AES_TAG_SIZE:
             raise ValueError("Invalid encrypted data")
         
         iv = data[:VPNProtocol.AES_IV_SIZE]
-        tag = data[VPNProtocol.AES_IV_SIZE:VPNProtocol.AES_IV_SIZE + 16]
-        ciphertext = data[VPNProtocol.AES_IV_SIZE + 16:]
-        
-        cipher = Cipher(
-            algorithms.AES(self.key),
-            modes.GCM(iv, tag),
-            backend=default_backend()
-        )
-        decryptor = cipher.decryptor()
-        return decryptor.update(ciphertext) + decryptor.finalize()
+        return self._aead.decrypt(iv, data[VPNProtocol.AES_IV_SIZE:], None)
 
 
 class VPNLogger:
     """Simple logging utility for VPN"""
     
+    # Messages below LOG_LEVEL (environment variable, default INFO) are dropped
+    LEVELS = {"INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40}
+    min_level = LEVELS.get(os.environ.get("LOG_LEVEL", "INFO").upper(), 20)
+    
+    # Formatted timestamp, regenerated at most once per second
+    _last_ts_sec = 0
+    _last_ts_str = ""
+    
+    # Optional callable(level, message) that replaces stdout, e.g. to feed a GUI log
+    sink = None
+    
     @staticmethod
-    def log(level: str, message: str, color: str = ""):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def enabled(level: str) -> bool:
+        """Whether a message at level would be emitted"""
+        return VPNLogger.LEVELS.get(level, 0) >= VPNLogger.min_level
+    
+    @staticmethod
+    def log(level: str, message: str, color: str = "", args: tuple = ()):
+        if VPNLogger.LEVELS.get(level, 0) < VPNLogger.min_level:
+            return
+        if args:
+            message = message % args  # only formatted once the level check passes
+        if VPNLogger.sink is not None:
+            VPNLogger.sink(level, message)
+            return
+        
+        sec = int(time.time())
+        if sec != VPNLogger._last_ts_sec:
+            VPNLogger._last_ts_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+            VPNLogger._last_ts_sec = sec
+        timestamp = VPNLogger._last_ts_str
+        
         if color:
-            print(f"{color}[{timestamp}] {level}: {message}{Style.RESET_ALL}")
+            sys.stdout.write(f"{color}[{timestamp}] {level}: {message}{Style.RESET_ALL}\n")
         else:
-            print(f"[{timestamp}] {level}: {message}")
+            sys.stdout.write(f"[{timestamp}] {level}: {message}\n")
     
     @staticmethod
-    def info(message: str):
-        VPNLogger.log("INFO", message, Fore.CYAN)
+    def info(message: str, *args):
+        VPNLogger.log("INFO", message, Fore.CYAN, args)
     
     @staticmethod
-    def success(message: str):
-        VPNLogger.log("SUCCESS", message, Fore.GREEN)
+    def success(message: str, *args):
+        VPNLogger.log("SUCCESS", message, Fore.GREEN, args)
     
     @staticmethod
-    def warning(message: str):
-        VPNLogger.log("WARNING", message, Fore.YELLOW)
+    def warning(message: str, *args):
+        VPNLogger.log("WARNING", message, Fore.YELLOW, args)
     
     @staticmethod
-    def error(message: str):
-        VPNLogger.log("ERROR", message, Fore.RED)
+    def error(message: str, *args):
+        VPNLogger.log("ERROR", message, Fore.RED, args)
 
 
 class ClientHandler:
     """Handles individual client connections"""
     
-    def __init__(self, socket: socket.socket, address: Tuple[str, int], users: Dict[str, str]):
-        self.socket = socket
+    __slots__ = ('reader', 'writer', 'address', 'user_keys', 'claimed_username',
+                 'client_cipher', 'encryption', 'authenticated', 'username', 'running')
+    
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 address: Tuple[str, int], user_keys: Dict[str, Tuple[bytes, bytes]]):
+        self.reader = reader
+        self.writer = writer
         self.address = address
-        self.users = users
+        self.user_keys = user_keys
+        self.claimed_username = None  # set by the handshake
+        self.client_cipher = None
         self.encryption = None
         self.authenticated = False
         self.username = None
         self.running = True
         
-    def handle(self):
+    async def handle(self):
         """Handle client connection"""
         try:
-            VPNLogger.info(f"New client connection from {self.address}")
+            VPNLogger.info("New client connection from %s", self.address)
             
             while self.running:
                 try:
-                    data = self.socket.recv(4096)
-                    if not data:
-                        break
-                    
-                    msg_type, payload = VPNProtocol.parse_packet(data)
-                    self._handle_message(msg_type, payload)
+                    header = await self.reader.readexactly(_HDR_SIZE)
+                    msg_type, length = VPNProtocol._unpack_header(header)
+                    if not self.authenticated and length > _PRE_AUTH_MAX_LENGTH.get(msg_type, 0):
+                        raise ValueError(f"Oversized pre-auth packet: {length} bytes")
+                    payload = await self.reader.readexactly(length)
+                    await self._handle_message(msg_type, payload)
+                    await self.writer.drain()  # stop reading while the peer isn't
                     
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
                 except Exception as e:
-                    VPNLogger.error(f"Error handling client {self.address}: {e}")
+                    VPNLogger.error("Error handling client %s: %s", self.address, e)
                     break
         
         finally:
-            self.socket.close()
-            VPNLogger.info(f"Client {self.address} disconnected")
+            # Drop the session key now rather than whenever the handler is collected
+            self.encryption = None
+            self.authenticated = False
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            VPNLogger.info("Client %s disconnected", self.address)
     
-    def _handle_message(self, msg_type: int, payload: bytes):
+    def _send_packet(self, msg_type: int, data: bytes = b''):
+        """Queue one packet on the transport, which retries short writes itself"""
+        header = VPNProtocol.create_header(msg_type, len(data))
+        if len(data) >= VPNProtocol.SEND_COPY_THRESHOLD:
+            # Python 3.12+ transports gather these with a single sendmsg
+            self.writer.writelines((header, data))
+        else:
+            self.writer.write(header + data)
+    
+    async def _run_crypto(self, func, data: bytes) -> bytes:
+        """Run an encrypt/decrypt call, on a worker thread for large payloads"""
+        if len(data) >= VPNProtocol.EXECUTOR_THRESHOLD:
+            # The AEAD releases the GIL, so the loop keeps serving other clients
+            return await asyncio.get_running_loop().run_in_executor(None, func, data)
+        return func(data)
+    
+    async def _handle_message(self, msg_type: int, payload: bytes):
         """Handle different message types"""
         if msg_type == VPNProtocol.MSG_HANDSHAKE:
             self._handle_handshake(payload)
         elif msg_type == VPNProtocol.MSG_AUTH:
             self._handle_auth(payload)
         elif msg_type == VPNProtocol.MSG_DATA:
-            self._handle_data(payload)
+            await self._handle_data(payload)
         elif msg_type == VPNProtocol.MSG_KEEPALIVE:
             self._handle_keepalive()
         elif msg_type == VPNProtocol.MSG_DISCONNECT:
             self._handle_disconnect()
         else:
-            VPNLogger.warning(f"Unknown message type from {self.address}: {msg_type}")
+            VPNLogger.warning("Unknown message type from %s: %s", self.address, msg_type)
     
     def _handle_handshake(self, payload: bytes):
         """Handle handshake message"""
         try:
-            data = json.loads(payload.decode())
-            client_version = data.get('client_version')
-            encryption_salt = base64.b64decode(data.get('encryption_salt', ''))
+            client_version, cipher, username = _HANDSHAKE_STRUCT.unpack(payload)
             
             if client_version != VPNProtocol.VERSION:
-                VPNLogger.error(f"Version mismatch with {self.address}: {client_version}")
+                self._reject_handshake("Version mismatch with %s: %s", self.address, client_version)
                 return
             
-            # Store salt for later encryption setup
-            self.client_salt = encryption_salt
+            if cipher not in VPNProtocol.CIPHERS:
+                self._reject_handshake("Unsupported cipher from %s: %s", self.address, cipher)
+                return
+            
+            # Software AES on either end slows both, so ChaCha20 wins if either prefers it
+            if VPNProtocol.CIPHER_CHACHA20_POLY1305 in (cipher, DEFAULT_CIPHER):
+                cipher = VPNProtocol.CIPHER_CHACHA20_POLY1305
+            
+            # Remember who is logging in; auth must be sealed with that user's key
+            self.claimed_username = username
+            self.client_cipher = cipher
+            entry = self.user_keys.get(username.decode(errors="replace"))
+            salt = entry[0] if entry is not None else _decoy_salt(username)
             
-            # Send handshake response
-            response_data = json.dumps({
-                'server_version': VPNProtocol.VERSION,
-                'status': 'ok'
-            }).encode()
+            # Send handshake response with the salt the user's key was derived with
+            response_data = _HANDSHAKE_REPLY_STRUCT.pack(VPNProtocol.VERSION,
+                                                         VPNProtocol.HANDSHAKE_OK, cipher, salt)
             
-            packet = VPNProtocol.create_packet(VPNProtocol.MSG_HANDSHAKE, response_data)
-            self.socket.send(packet)
+            self._send_packet(VPNProtocol.MSG_HANDSHAKE, response_data)
             
-            VPNLogger.info(f"Handshake completed with {self.address}")
+            VPNLogger.info("Handshake completed with %s", self.address)
             
         except Exception as e:
-            VPNLogger.error(f"Handshake error with {self.address}: {e}")
+            self._reject_handshake("Handshake error with %s: %s", self.address, e)
+    
+    def _reject_handshake(self, reason: str, *args):
+        """Log why the handshake failed, tell the client and end the connection"""
+        VPNLogger.error(reason, *args)
+        self.writer.write(_PKT_HANDSHAKE_REJECTED)
+        self.running = False  # handle() closes the socket once the reply is drained
     
     def _handle_auth(self, payload: bytes):
         """Handle authentication message"""
         try:
-            if not hasattr(self, 'client_salt'):
+            if self.claimed_username is None:
                 self._send_auth_failure()
                 return
             
-            # Try to decrypt with each user's password
-            for username, password in self.users.items():
+            username = self.claimed_username.decode(errors="replace")
+            entry = self.user_keys.get(username)
+            
+            if entry is not None:
                 try:
-                    # Create encryption with user's password and client's salt
-                    temp_encryption = VPNEncryption(password)
-                    temp_encryption.salt = self.client_salt
-                    temp_encryption.key = temp_encryption._derive_key()
+                    # The user's key was derived when the account was added; no PBKDF2 here
+                    salt, key = entry
+                    encryption = VPNEncryption.from_key(key, salt, self.client_cipher)
+                    timestamp, auth_username = _AUTH_STRUCT.unpack(encryption.decrypt(payload))
                     
-                    # Try to decrypt
-                    decrypted = temp_encryption.decrypt(payload)
-                    auth_data = json.loads(decrypted.decode())
-                    
-                    if auth_data.get('username') == username:
+                    # The sealed name must match the one the handshake looked up
+                    if hmac.compare_digest(auth_username, self.claimed_username):
                         # Authentication successful
                         self.username = username
-                        self.encryption = temp_encryption
+                        self.encryption = encryption
                         self.authenticated = True
                         self._send_auth_success()
-                        VPNLogger.success(f"User {username} authenticated from {self.address}")
+                        VPNLogger.success("User %s authenticated from %s", username, self.address)
                         return
                         
                 except:
-                    continue
+                    pass
             
             # If we get here, authentication failed
             self._send_auth_failure()
-            VPNLogger.warning(f"Authentication failed for {self.address}")
+            VPNLogger.warning("Authentication failed for %s", self.address)
             
         except Exception as e:
-            VPNLogger.error(f"Authentication error with {self.address}: {e}")
+            VPNLogger.error("Authentication error with %s: %s", self.address, e)
             self._send_auth_failure()
     
     def _send_auth_success(self):
         """Send authentication success message"""
-        packet = VPNProtocol.create_packet(VPNProtocol.MSG_AUTH_SUCCESS)
-        self.socket.send(packet)
+        self.writer.write(_PKT_AUTH_SUCCESS)
     
     def _send_auth_failure(self):
         """Send authentication failure message"""
-        packet = VPNProtocol.create_packet(VPNProtocol.MSG_AUTH_FAILURE)
-        self.socket.send(packet)
+        self.writer.write(_PKT_AUTH_FAILURE)
     
-    def _handle_data(self, payload: bytes):
+    async def _handle_data(self, payload: bytes):
         """Handle data message (echo back for demo)"""
         if not self.authenticated:
-            VPNLogger.warning(f"Unauthenticated data from {self.address}")
+            VPNLogger.warning("Unauthenticated data from %s", self.address)
             return
         
         try:
-            # Decrypt data
-            decrypted = self.encryption.decrypt(payload)
-            VPNLogger.info(f"Received from {self.username}@{self.address}: {decrypted.decode()}")
+            # Decrypt data; one frame may carry several batched messages
+            decrypted = await self._run_crypto(self.encryption.decrypt, payload)
+            echoes = []
+            log_messages = VPNLogger.enabled("INFO")  # skip decoding when it isn't logged
+            for message in VPNProtocol.unpack_records(decrypted):
+                if log_messages:
+                    VPNLogger.info("Received from %s@%s: %s", self.username, self.address,
+                                   message.decode(errors="replace"))
+                echoes.append(VPNProtocol.pack_record(b"Echo: " + message))
             
             # Echo back (in real VPN, this would be forwarded to destination)
-            echo_data = f"Echo: {decrypted.decode()}"
-            encrypted_echo = self.encryption.encrypt(echo_data.encode())
-            packet = VPNProtocol.create_packet(VPNProtocol.MSG_DATA, encrypted_echo)
-            self.socket.send(packet)
+            encrypted_echo = await self._run_crypto(self.encryption.encrypt, b''.join(echoes))
+            self._send_packet(VPNProtocol.MSG_DATA, encrypted_echo)
             
         except Exception as e:
-            VPNLogger.error(f"Data handling error with {self.address}: {e}")
+            VPNLogger.error("Data handling error with %s: %s", self.address, e)
     
     def _handle_keepalive(self):
         """Handle keep-alive message"""
         # Send keep-alive response
-        packet = VPNProtocol.create_packet(VPNProtocol.MSG_KEEPALIVE)
-        self.socket.send(packet)
+        self.writer.write(_PKT_KEEPALIVE)
     
     def _handle_disconnect(self):
         """Handle disconnect message"""
-        VPNLogger.info(f"Client {self.address} requested disconnect")
+        VPNLogger.info("Client %s requested disconnect", self.address)
         self.running = False
 
 
 class VPNServer:
     """VPN Server implementation"""
     
+    __slots__ = ('host', 'port', 'socket', 'running', 'clients', '_client_tasks',
+                 '_loop', '_stop_event', 'users', 'user_keys')
+    
+    # Kernel send/receive buffer per connection, sized for bulk data on high-latency links
+    SOCKET_BUFFER_SIZE = 1 << 20
+    # Seconds stop() gives open connections to close cleanly
+    STOP_TIMEOUT = 2
+    
     def __init__(self, host: str = "0.0.0.0", port: int = 8080):
         self.host = host
         self.port = port
         self.socket = None
         self.running = False
-        self.clients = []
+        self.clients = set()  # live ClientHandlers only
+        self._client_tasks = set()
+        self._loop = None
+        self._stop_event = None
         
         # Default users (in production, use proper user management)
         self.users = {
@@ -330,51 +607,96 @@ class VPNServer:
             "user1": "password1",
             "user2": "password2"
         }
+        # username -> (salt, key); auth only ever uses these pre-derived keys
+        self.user_keys: Dict[str, Tuple[bytes, bytes]] = {}
+        for username, password in self.users.items():
+            self._derive_user_key(username, password)
     
     def start(self):
-        """Start the VPN server"""
+        """Start the VPN server; blocks until stop() is called"""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # Set before listen(): accepted sockets inherit them, and the receive
+            # window scale is fixed during the handshake
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SOCKET_BUFFER_SIZE)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.SOCKET_BUFFER_SIZE)
             self.socket.bind((self.host, self.port))
-            self.socket.listen(10)
+            self.socket.listen(socket.SOMAXCONN)  # let connection bursts queue in the kernel
             
             self.running = True
             
-            VPNLogger.success(f"VPN Server started on {self.host}:{self.port}")
-            VPNLogger.info(f"Available users: {', '.join(self.users.keys())}")
-            
-            while self.running:
-                try:
-                    client_socket, address = self.socket.accept()
-                    
-                    # Handle client in separate thread
-                    handler = ClientHandler(client_socket, address, self.users)
-                    client_thread = threading.Thread(target=handler.handle, daemon=True)
-                    client_thread.start()
-                    
-                    self.clients.append(handler)
-                    
-                except socket.error:
-                    if self.running:
-                        VPNLogger.error("Socket error in server loop")
-                    break
+            # One event loop thread serves every connection
+            asyncio.run(self._serve())
         
         except Exception as e:
             VPNLogger.error(f"Server error: {e}")
         
         finally:
-            self.stop()
+            self.running = False
+            self._loop = None
+            if self.socket:
+                self.socket.close()
+            VPNLogger.info("VPN Server stopped")
+    
+    async def _serve(self):
+        """Accept clients on the listening socket until stop() is called"""
+        self._stop_event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if not self.running:
+            return  # stop() arrived before the loop was up
+        
+        server = await asyncio.start_server(self._on_client, sock=self.socket)
+        VPNLogger.success(f"VPN Server started on {self.host}:{self.port}")
+        VPNLogger.info(f"Available users: {', '.join(self.users.keys())}")
+        
+        await self._stop_event.wait()
+        server.close()
+        for handler in list(self.clients):
+            handler.writer.close()
+        await server.wait_closed()
+        if self._client_tasks:
+            # Let each handler finish its cleanup instead of being cancelled by asyncio.run;
+            # the timeout covers peers that never read what is still queued for them
+            await asyncio.wait(self._client_tasks, timeout=self.STOP_TIMEOUT)
+    
+    async def _on_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one accepted connection"""
+        client_socket = writer.get_extra_info('socket')
+        # Replies are small and latency-bound; let the OS probe idle peers too
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        
+        handler = ClientHandler(reader, writer, writer.get_extra_info('peername'), self.user_keys)
+        task = asyncio.current_task()
+        self.clients.add(handler)
+        self._client_tasks.add(task)
+        try:
+            await handler.handle()
+        finally:
+            self.clients.discard(handler)
+            self._client_tasks.discard(task)
     
     def stop(self):
-        """Stop the VPN server"""
+        """Stop the VPN server; safe to call from any thread"""
         self.running = False
-        if self.socket:
-            self.socket.close()
-        VPNLogger.info("VPN Server stopped")
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass  # loop already closed
+    
+    def _derive_user_key(self, username: str, password: str):
+        """Run PBKDF2 for a user once, under a fresh per-user salt"""
+        salt = _ENTROPY.draw(VPNProtocol.SALT_SIZE)
+        self.user_keys[username] = (salt, _pbkdf2(password.encode(), salt,
+                                                  VPNProtocol.KDF_ITERATIONS,
+                                                  VPNProtocol.AES_KEY_SIZE))
     
     def add_user(self, username: str, password: str):
         """Add a new user"""
+        self._derive_user_key(username, password)
         self.users[username] = password
         VPNLogger.info(f"User {username} added")
     
@@ -382,9 +704,28 @@ class VPNServer:
         """Remove a user"""
         if username in self.users:
             del self.users[username]
+            del self.user_keys[username]
             VPNLogger.info(f"User {username} removed")
 
 
+def run_server_process(host: str, port: int, log_queue, command_queue):
+    """Run a VPNServer in a child process, logging to log_queue and obeying command_queue"""
+    VPNLogger.sink = lambda level, message: log_queue.put(f"{level}: {message}")
+    server = VPNServer(host, port)
+    
+    def serve_commands():
+        while True:
+            command, *args = command_queue.get()
+            if command == "add_user":
+                server.add_user(*args)
+            elif command == "stop":
+                server.stop()
+                return
+    
+    threading.Thread(target=serve_commands, daemon=True).start()
+    server.start()
+
+
 if __name__ == "__main__":
     print(f"{Fore.GREEN}{Style.BRIGHT}")
     print("=" * 50)
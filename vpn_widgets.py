@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Fosen VPN Widgets - Tkinter building blocks shared by the server and client GUIs
+"""
+
+import tkinter as tk
+from tkinter import ttk, scrolledtext
+from typing import Tuple
+
+
+def build_log_frame(parent: tk.Misc, title: str, row: int,
+                    height: int = 15) -> Tuple[ttk.LabelFrame, scrolledtext.ScrolledText]:
+    """Grid a titled log frame at row of parent and return it with its text widget"""
+    log_frame = ttk.LabelFrame(parent, text=title, padding="5")
+    log_frame.grid(row=row, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
+    log_frame.columnconfigure(0, weight=1)
+    log_frame.rowconfigure(0, weight=1)
+    
+    # Read-only with no undo stack: the log is only ever appended to by _flush_log
+    log_text = scrolledtext.ScrolledText(log_frame, height=height, width=70,
+                                         undo=False, state=tk.DISABLED)
+    log_text.grid(row=0, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
+    return log_frame, log_text
+
+
+def build_credential_row(parent: tk.Misc, row: int, username: str = "",
+                         password: str = "") -> Tuple[ttk.Entry, ttk.Entry]:
+    """Grid Username/Password label and entry pairs in columns 0-3 of row"""
+    ttk.Label(parent, text="Username:").grid(row=row, column=0, sticky=tk.W, padx=(0, 5))
+    username_entry = ttk.Entry(parent)
+    username_entry.insert(0, username)
+    username_entry.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=(0, 10))
+    
+    ttk.Label(parent, text="Password:").grid(row=row, column=2, sticky=tk.W, padx=(10, 5))
+    password_entry = ttk.Entry(parent, show="*")
+    password_entry.insert(0, password)
+    password_entry.grid(row=row, column=3, sticky=(tk.W, tk.E), padx=(0, 10))
+    return username_entry, password_entry